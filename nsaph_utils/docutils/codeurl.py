@@ -17,38 +17,43 @@
 #  limitations under the License.
 #
 
+import functools
+import logging
 import os
+from pathlib import PurePosixPath
 
 from docutils.nodes import Element
 from sphinx.addnodes import pending_xref
 from sphinx.domains import Domain
 
 
+logger = logging.getLogger(__name__)
+
+_CODE_EXTS = frozenset({"py"})
+"""Extensions of targets that are resolved as links to module pages"""
+
+
 class URLDomain(Domain):
     """
     Resolve code links in markdown files .
     """
 
     def resolve_any_xref(self, env, fromdocname, builder, target, node, contnode):
-        code_url = None
-        if ".html" not in target and 'http' not in target and (
-            target.endswith('py')
-        ):
+        ext = target.rpartition('.')[2]
+        if ext in _CODE_EXTS and 'http' not in target:
             code_url = self.link(target)
-        if code_url is not None:
-            print("Ref {}: {} ==> {}".format(fromdocname, target, code_url))
+            logger.debug("Ref %s: %s ==> %s", fromdocname, target, code_url)
             contnode["refuri"] = code_url
             return [("code:module", contnode)]
-        if (".html" not in target and 'http' not in target) and (
-            "../nsaph/" in target
-        ):
+        if "../nsaph/" in target and ".html" not in target \
+                and 'http' not in target:
             base, ext = os.path.splitext(target)
             if not ext or ext == ".md":
                 new_target = base + ".html"
             else:
                 new_target = target
             new_target = new_target.replace("../nsaph/", "../platform/")
-            print("Ref {}: {} ==> {}".format(fromdocname, target, new_target))
+            logger.debug("Ref %s: %s ==> %s", fromdocname, target, new_target)
             contnode["refuri"] = new_target
             return [("md:module", contnode)]
         #print("XRef1 {}: {}".format(fromdocname, target))
@@ -57,22 +62,23 @@ class URLDomain(Domain):
     def resolve_xref(self, env, fromdocname: str,
                      builder, typ: str, target: str,
                      node: pending_xref, contnode: Element) -> Element:
-        print("XRef2 {}: {} [{}]".format(fromdocname, target, typ))
+        logger.debug("XRef2 %s: %s [%s]", fromdocname, target, typ)
         return super().resolve_xref(env, fromdocname, builder, typ, target,
                                     node, contnode)
 
     @staticmethod
     def link(path: str) -> str:
-        name = os.path.basename(path)
-        x = name.split('.')
-        if len(x) < 2:
-            return path
-        x[1] = "html"
-        if "../nsaph/" in path:
-            return os.path.join("..", "..", "..", "platform", "doc", "members", '.'.join(x))
-        if path.startswith('../'):
-            return os.path.join("members", '.'.join(x))
-        return os.path.join("doc", "members", '.'.join(x))
-
+        return _link(path)
 
 
+@functools.lru_cache(maxsize=4096)
+def _link(path: str) -> str:
+    p = PurePosixPath(path)
+    if not p.suffix:
+        return path
+    html_name = p.stem + ".html"
+    if "../nsaph/" in path:
+        return PurePosixPath("../../../platform/doc/members", html_name).as_posix()
+    if p.parts[:1] == ('..',):
+        return PurePosixPath("members", html_name).as_posix()
+    return PurePosixPath("doc/members", html_name).as_posix()
@@ -17,6 +17,7 @@
 #  limitations under the License.
 #
 
+import fnmatch
 import glob
 import os
 import sys
@@ -44,10 +45,29 @@ class ModuleCollector:
         self.pattern = pattern
         self.template = template
 
+    def modules(self, source_path: str):
+        """
+        Lazily iterates over source files matching the pattern
+
+        :param source_path: root directory of the sources
+        :return: generator of paths to the matching files
+        """
+
+        name_pattern = self.pattern[3:]
+        if not self.pattern.startswith("**/") or '/' in name_pattern:
+            yield from glob.iglob(os.path.join(source_path, self.pattern),
+                                  recursive=True)
+            return
+        for root, dirs, files in os.walk(source_path):
+            # like glob, do not descend into hidden directories
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in fnmatch.filter(files, name_pattern):
+                if name[0] in "._":
+                    continue
+                yield os.path.join(root, name)
+
     def collect(self, source_path: str):
-        modules = glob.glob(os.path.join(source_path, self.pattern),
-                            recursive=True)
-        for module in modules:
+        for module in self.modules(source_path):
             name = os.path.basename(module)
             name, _ = os.path.splitext(name)
             if name.startswith("_"):
@@ -55,10 +75,11 @@ class ModuleCollector:
             target = name + ".rst"
             target = os.path.join(self.dest, target)
             if os.path.exists(target):
-                with open(target) as f:
-                    lines = [line for line in f][:2]
-                    if lines[0].strip() != '..' or lines[1].strip() != "autogenerated":
-                        continue
+                with open(target, "rb") as f:
+                    lines = f.read(64).splitlines()
+                if len(lines) < 2 or lines[0].strip() != b'..' \
+                        or lines[1].strip() != b"autogenerated":
+                    continue
             x, _ = os.path.splitext(os.path.relpath(module, source_path))
             x = x.replace('/', '.')
             content = self.template.format(name=name, module=x)
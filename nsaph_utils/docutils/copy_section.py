@@ -18,46 +18,56 @@
 #
 
 import os
+import re
 import sys
 from typing import List
 
+_SECTION_START = re.compile(
+    r'^<!--\s*section\s+(.+?)\s+from\s+(\S+?)\s*-->', re.IGNORECASE
+)
+_SECTION_END = re.compile(
+    r'^<!--\s*end\s+of\s+section\s+(.+?)\s+from\s+(\S+?)\s*-->',
+    re.IGNORECASE
+)
+_END_OF_SECTION = "<!-- end of section {} from {} -->\n"
+
 
 def get_header_level(line: str) -> int:
-    for i in range(len(line)):
-        if line[i] != '#':
-            return i
-    return -1
+    stripped = line.lstrip('#')
+    if not stripped:
+        return -1
+    return len(line) - len(stripped)
 
 
 def read_section(source: str, section: str) -> List[str]:
-    content: List[str] = []
-    inside = False
-    level = None
     with open(source, "rt") as f:
-        for line in f:
-            if not line.startswith('#'):
-                if inside:
-                    content.append(line)
-                continue
-            lh = get_header_level(line)
-            if not inside:
-                header = line[lh:].strip()
-                if header.lower() != section.lower():
-                    continue
-                level = lh
-                inside = True
-                continue
-            if lh <= level:
-                break
-
-    return content
+        text = f.read()
+    header = re.compile(
+        r'^(#+)[^\S\n]*' + re.escape(section.strip()) + r'[^\S\n]*$',
+        re.IGNORECASE | re.MULTILINE
+    ).search(text)
+    if header is None:
+        return []
+    level = len(header.group(1))
+    start = text.find('\n', header.end()) + 1
+    if start == 0:
+        return []
+    end = re.compile(r'^#{1,%d}(?!#)' % level, re.MULTILINE).search(text, start)
+    if end is not None:
+        text = text[start:end.start()]
+    else:
+        text = text[start:]
+    return [
+        line for line in text.splitlines(keepends=True)
+        if not line.startswith('#')
+    ]
 
 
 def insert_section(source: str, to: str, project: str = None):
     if project is None:
         project = os.path.basename(os.path.dirname(source))
     with open(to, "rt") as f:
-        content = [line for line in f]
+        content = f.readlines()
     start = None
     end = None
     section = None
@@ -65,40 +75,31 @@ def insert_section(source: str, to: str, project: str = None):
     for l1, line in enumerate(content):
         if not line.startswith("<!--"):
             continue
-        statement = line[4:].strip().lower()
         if start is None:
-            if statement.startswith("section"):
-                tokens = statement.split()
-                if len(tokens) < 3:
-                    continue
-                try:
-                    n = tokens.index("from")
-                except ValueError:
-                    n = len(tokens)
-                if project != tokens[n+1]:
-                    continue
-                section = ' '.join(tokens[1:n])
-                start = l1
-                end_of_section = "<!-- end of section {} from {} -->\n"\
-                    .format(section, project)
+            m = _SECTION_START.match(line)
+            if m is None or m.group(2).lower() != project.lower():
                 continue
+            section = ' '.join(m.group(1).lower().split())
+            start = l1
+            end_of_section = _END_OF_SECTION.format(section, project)
+            continue
         if line == end_of_section:
             end = l1 + 1
             break
+        m = _SECTION_END.match(line)
+        if m is not None and m.group(2).lower() == project.lower() \
+                and ' '.join(m.group(1).lower().split()) == section:
+            end = l1 + 1
+            break
     if start is None:
         raise ValueError("Not found")
     section_content = read_section(source, section)
+    if end is None:
+        end = start + 2
+    output = content[:start + 1] + ["\n"] + section_content \
+        + [end_of_section] + content[end:]
     with open(to, "wt") as f:
-        for line in content[:start + 1]:
-            f.write(line)
-        f.write("\n")
-        for line in section_content:
-            f.write(line)
-        f.write(end_of_section)
-        if end is None:
-            end = start + 2
-        for line in content[end:]:
-            f.write(line)
+        f.write(''.join(output))
     return
 
 
@@ -17,17 +17,131 @@
 #  limitations under the License.
 #
 
+import functools
+import io
+import mmap
 import os
 import sys
-from typing import Dict, Optional
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 from pathlib import Path
 import yaml
 
+from nsaph_utils.utils.yaml_utils import SafeLoader
+
+TOC_BLOCK = "<!-- toc -->\n\n{}\n<!-- tocstop -->\n\n"
+"""Table of contents block, in the format produced by markdown-toc"""
+
+NSAPH_MEMBERS = os.path.join("..", "..", "..", "..", "platform", "doc", "members")
+"""Relative location of documentation for NSAPH platform modules"""
+
+PYTHON_SOURCES = os.path.join("..", "..", "src", "python")
+"""Relative location of Python sources of the project"""
+
+SECTIONS = [
+    ("doc", "Description"),
+    ("inputs", "Inputs"),
+    ("outputs", "Outputs"),
+    ("steps", "Steps")
+]
+"""CWL keys documented as second level sections and their headers"""
+
+SOURCE_TEMPLATE = "\n**Source**: [{}]({})\n\n"
+"""Link to the CWL source, formatted with file name and relative path"""
+
+DESCRIPTION_TEMPLATE = "## Description\n{}\n\n"
+"""Description section, formatted with the CWL doc"""
+
+INPUTS_HEADER = (
+    "## Inputs\n\n"
+    "| Name | Type | Default | Description |\n"
+    "|------|------|---------|-------------|\n"
+)
+"""Header of the Inputs section and its table"""
+
+OUTPUTS_HEADER = (
+    "\n## Outputs\n\n"
+    "| Name | Type | Description |\n"
+    "|------|------|-------------|\n"
+)
+"""Header of the Outputs section and its table"""
+
+STEPS_HEADER = (
+    "\n## Steps\n\n"
+    "| Name | Runs | Description |\n"
+    "|------|------|-------------|\n"
+)
+"""Header of the Steps section and its table"""
+
+TITLE_SCAN_SIZE = 4096
+"""Number of bytes in the head of a CWL file scanned for a title first"""
+
+MMAP_THRESHOLD = 64 * 1024
+"""CWL files of this size or larger are memory mapped instead of read"""
+
+_DOC_TRANS = str.maketrans({'\n': ' '})
+_TYPE_TRANS = str.maketrans({'?': None})
+
+
+def safe_load(stream):
+    """
+    Same as yaml.safe_load but uses libyaml parser when it is available
+
+    :param stream: string, bytes or a file-like object with YAML content
+    :return: Parsed content
+    """
+
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def find_title(raw: Union[bytes, mmap.mmap]) -> Optional[str]:
+    """
+    Finds a document title, the first comment line starting with ``###``
+
+    The title is normally in the first few lines, therefore only
+    the head of the file is scanned unless the title is not found there
+
+    :param raw: binary content of a CWL file, bytes or mmap
+    :return: title or None if the file has no title line
+    """
+
+    head = raw[:raw.rfind(b'\n', 0, TITLE_SCAN_SIZE) + 1]
+    for chunk in (head, raw[len(head):]):
+        for line in chunk.splitlines():
+            if line.startswith(b"###"):
+                return line[3:].decode("utf-8").strip()
+    return None
+
+
+def load_cwl(path_to_cwl: str) -> Tuple[Dict, Optional[str]]:
+    """
+    Reads and parses a CWL file. Large files are memory mapped
+    and passed to the parser without copying them to a bytes object
+
+    :param path_to_cwl: path to a CWL file
+    :return: a tuple: parsed content and title (or None)
+    """
+
+    with open(path_to_cwl, "rb") as yml:
+        if os.fstat(yml.fileno()).st_size < MMAP_THRESHOLD:
+            raw = yml.read()
+            return safe_load(raw), find_title(raw)
+        with mmap.mmap(yml.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return safe_load(mm), find_title(mm)
+
 
 def find_tool(content: Dict) -> str:
     if "baseCommand" not in content:
         return ""
     command = content["baseCommand"]
+    if isinstance(command, str):
+        command = command.split()
+    return _find_tool(tuple(command))
+
+
+@functools.lru_cache(maxsize=None)
+def _find_tool(command: Tuple[str, ...]) -> str:
     if command[0] != "python":
         return '`{}`'.format(" ".join(command))
 
@@ -42,6 +156,8 @@ def find_tool(content: Dict) -> str:
                 module = c
                 break
 
+    if not module:
+        return '`{}`'.format(" ".join(command))
     path = ""
     if module.endswith(".py"):
         name = os.path.basename(module)[:-3]
@@ -49,105 +165,166 @@ def find_tool(content: Dict) -> str:
         x = module.split('.')
         name = x[-1]
         path = x[:-1]
-    if not module:
-        return '`{}`'.format(" ".join(command))
     if module.startswith("nsaph.") or "/nsaph/" in module:
-        target = os.path.join("..", "..", "..", "..",
-                              "platform", "doc", "members", name + ".html")
+        target = os.path.join(NSAPH_MEMBERS, name + ".html")
     else:
-        target = os.path.join("..", "..", "src", "python", *path, name + ".py")
+        target = os.path.join(PYTHON_SOURCES, *path, name + ".py")
     return "[{}]({})".format(module, target)
 
 
+def slug(header: str) -> str:
+    """
+    Returns GitHub style anchor for a markdown header
+    """
+
+    s = ''.join(c for c in header.strip().lower() if c.isalnum() or c in " -_")
+    return s.replace(' ', '-')
+
+
+def toc(content: Dict) -> str:
+    """
+    Builds a table of contents for the sections that will be written
+    for a given CWL document
+    """
+
+    return TOC_BLOCK.format(''.join(
+        "- [{}](#{})\n".format(header, slug(header))
+        for key, header in SECTIONS if key in content
+    ))
+
+
+def _doc(arg: Dict) -> str:
+    doc = arg.get("doc", " ")
+    if '\n' in doc:
+        doc = doc.translate(_DOC_TRANS)
+    return doc
+
+
+def _type(arg: Dict) -> str:
+    tp = arg.get("type", "string")
+    if '?' in tp:
+        tp = tp.translate(_TYPE_TRANS)
+    return tp
+
+
+def input_rows(inputs: Dict) -> Iterator[str]:
+    row = "|{}|{}|{}|{}|\n".format
+    for name, arg in inputs.items():
+        doc = _doc(arg)
+        tp = _type(arg)
+        df = arg.get("default", None)
+        if df is not None:
+            df = "`{}`".format(df)
+        else:
+            df = " "
+        yield row(name, tp, df, doc)
+
+
+def output_rows(outputs: Dict) -> Iterator[str]:
+    row = "|{}|{}|{}|\n".format
+    for name, arg in outputs.items():
+        doc = _doc(arg)
+        tp = _type(arg)
+        yield row(name, tp, doc)
+
+
+def _with_suffix(path: str, suffix: str) -> str:
+    """
+    Replaces extension of a CWL file, in any case, with the given suffix
+    """
+
+    base, ext = os.path.splitext(path)
+    if ext.lower() == ".cwl":
+        return base + suffix
+    return path.replace(".cwl", suffix)
+
+
+def step_rows(steps: Dict, t_ref_mode: str) -> Iterator[str]:
+    row = "|{}|[{}]({})|{}|\n".format
+    suffix = "." + t_ref_mode
+    for name, arg in steps.items():
+        doc = _doc(arg)
+        runs = arg["run"]
+        yield row(name, runs, _with_suffix(runs, suffix), doc)
+
+
 def document(path_to_cwl: str, t_ref_mode: str):
     p = Path(path_to_cwl)
     name = os.path.basename(path_to_cwl)
     path_to_md_dir  = os.path.join(p.parents[2], "doc", "pipeline")
     if not os.path.isdir(path_to_md_dir):
         os.makedirs(path_to_md_dir, exist_ok=True)
-    path_to_md = os.path.join(path_to_md_dir, name.replace(".cwl", ".md"))
-    with open(path_to_cwl, "rt") as yml:
-        content = yaml.safe_load(yml)
-        yml.seek(0)
-        comments = [
-            line for line in yml if line.startswith("###")
-        ]
-        title = comments[0][3:].strip()
-        tool = find_tool(content)
-
-    with open (path_to_md, "wt") as md:
-        print("# {}".format(title), file=md)
-        if "tool" in content["class"].lower():
-            print("**Tool** \t{}".format(tool), file=md)
-        elif "workflow" in content["class"].lower():
-            print("**Workflow**", file=md)
-        print(file=md)
-        src_path = os.path.relpath(path_to_cwl, os.path.dirname(path_to_md))
-        print("**Source**: [{}]({})".format(name, src_path), file=md)
-        print(file=md)
-        print("<!-- toc -->", file=md)
-        print(file=md)
+    path_to_md = os.path.join(path_to_md_dir, _with_suffix(name, ".md"))
+    content, title = load_cwl(path_to_cwl)
+    title = title or os.path.splitext(name)[0]
+    tool = find_tool(content)
+    cwl_class = str(content["class"]).lower()
+
+    src_path = os.path.relpath(path_to_cwl, os.path.dirname(path_to_md))
+    with io.StringIO() as md:
+        md.write("# {}\n".format(title))
+        if "tool" in cwl_class:
+            md.write("**Tool** \t{}\n".format(tool))
+        elif "workflow" in cwl_class:
+            md.write("**Workflow**\n")
+        md.write(SOURCE_TEMPLATE.format(name, src_path))
+        md.write(toc(content))
         if "doc" in content:
-            print("## Description", file=md)
-            print(content["doc"], file=md)
-            print(file=md)
+            md.write(DESCRIPTION_TEMPLATE.format(content["doc"]))
         if "inputs" in content:
-            print("## Inputs", file=md)
-            print(file=md)
-            print("| Name | Type | Default | Description |", file=md)
-            print("|------|------|---------|-------------|", file=md)
-            for name in content["inputs"]:
-                arg = content["inputs"][name]
-                doc = arg.get("doc", " ").replace('\n', ' ')
-                tp = arg.get("type", "string").replace('?', '')
-                df = arg.get("default", None)
-                if df is not None:
-                    df = "`{}`".format(df)
-                else:
-                    df = " "
-
-                print("|{name}|{type}|{default}|{desc}|"
-                      .format(name=name, type=tp, default=df, desc=doc),
-                      file=md)
-
+            md.write(INPUTS_HEADER)
+            md.writelines(input_rows(content["inputs"]))
         if "outputs" in content:
-            print(file=md)
-            print("## Outputs", file=md)
-            print(file=md)
-            print("| Name | Type | Description |", file=md)
-            print("|------|------|-------------|", file=md)
-            for name in content["outputs"]:
-                arg = content["outputs"][name]
-                doc = arg.get("doc", " ").replace('\n', ' ')
-                tp = arg.get("type", "string").replace('?', '')
-                print("|{name}|{type}|{desc}|"
-                      .format(name=name, type=tp, desc=doc),
-                      file=md)
-
+            md.write(OUTPUTS_HEADER)
+            md.writelines(output_rows(content["outputs"]))
         if "steps" in content:
-            steps = content["steps"]
-            print(file=md)
-            print("## Steps", file=md)
-            print(file=md)
-            print("| Name | Runs | Description |", file=md)
-            print("|------|------|-------------|", file=md)
-            for name in steps:
-                arg = steps[name]
-                doc = arg.get("doc", " ").replace('\n', ' ')
-                runs = arg["run"]
-                target = runs.replace(".cwl", "." + t_ref_mode)
-                print("|{name}|[{runs}]({target})|{desc}|"
-                      .format(name=name, runs=runs, target=target, desc=doc),
-                      file=md)
-
-    os.system(" ~/node_modules/.bin/markdown-toc -i {}".format(path_to_md))
+            md.write(STEPS_HEADER)
+            md.writelines(step_rows(content["steps"], t_ref_mode))
+
+        with open(path_to_md, "wb") as out:
+            out.write(md.getvalue().encode("utf-8"))
     return 
 
 
+def list_cwl(path: str) -> List[str]:
+    """
+    Lists CWL files to document
+
+    :param path: a path to a single CWL file or to a directory
+        containing CWL files
+    :return: list of paths to CWL files
+    """
+
+    if not os.path.isdir(path):
+        return [path]
+    with os.scandir(os.path.abspath(path)) as entries:
+        return sorted(
+            entry.path for entry in entries
+            if entry.name.lower().endswith(".cwl") and entry.is_file()
+        )
+
+
+def document_all(paths: List[str], t_ref_mode: str = "md"):
+    """
+    Documents several CWL files in parallel processes
+
+    :param paths: list of paths to CWL files
+    :param t_ref_mode: extension to use for links to the steps
+    """
+
+    if len(paths) < 2:
+        for path in paths:
+            document(path, t_ref_mode)
+        return
+    workers = min(len(paths), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(document, paths, repeat(t_ref_mode), chunksize=4))
+
+
 if __name__ == '__main__':
     if len(sys.argv) > 2:
         table_ref_mode = sys.argv[2]
     else:
         table_ref_mode = "md"
-    document(sys.argv[1], table_ref_mode)
+    document_all(list_cwl(sys.argv[1]), table_ref_mode)
 
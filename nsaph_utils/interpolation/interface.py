@@ -19,11 +19,14 @@
 
 # Code for wrapping the various interpolation functions
 from .interpolate_ma import interpolate_ma
+import numpy as np
 import pandas as pd
 import logging
 
 IMPLEMENTED_METHODS = ['ma']
 LOG = logging.getLogger(__name__)
+PROGRESS_EVERY = 10000
+"""Number of units interpolated between two progress messages"""
 
 
 def interpolate(data: pd.DataFrame, interpolate_vars: list, method: str, tvar: str, by_var: str, ma_num: int = 4):
@@ -46,17 +49,31 @@ def interpolate(data: pd.DataFrame, interpolate_vars: list, method: str, tvar: s
 
     if method == "ma":
         data.sort_values(by=[tvar, by_var], inplace=True)
-        id_vals = data[by_var].unique()
+        # Build the group index once: a stable sort by unit keeps
+        # each unit's rows contiguous and still ordered by time.
+        # Rows with missing id (code -1) do not belong to any unit
+        # and are left as is
+        codes, units = pd.factorize(data[by_var])
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(order)]))
+        groups = [
+            (start, end) for start, end in zip(starts, ends)
+            if end > start and codes[order[start]] >= 0
+        ]
+        LOG.info("Interpolating " + str(len(units)) + " units")
 
         for data_var in interpolate_vars:
             LOG.info("Interpolating " + data_var)
-            id_count = 1
-            for id_val in id_vals:
-                if id_count == 1 or id_count % 1000 == 0:
-                    LOG.info(("Interpolating Unit " + str(id_count) +  " of " + str(len(id_vals))))
-                data.loc[data[by_var] == id_val, data_var] = interpolate_ma(data[data[by_var] == id_val][data_var],
-                                                                            ma_num)
-                id_count += 1
+            column = data[data_var].to_numpy(copy=True)
+            values = column[order]
+            for n in range(0, len(groups), PROGRESS_EVERY):
+                LOG.info("Interpolating Unit " + str(n + 1) + " of " + str(len(groups)))
+                for start, end in groups[n:n + PROGRESS_EVERY]:
+                    values[start:end] = interpolate_ma(values[start:end], ma_num)
+            column[order] = values
+            data[data_var] = column
 
     return True
 
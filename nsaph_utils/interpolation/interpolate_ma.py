@@ -46,34 +46,45 @@ def interpolate_ma(num_vec: np.array, k: int):
     # 2. Creates a copy to fill the missing data in
     with_missing = np.array(num_vec)
     out = with_missing.copy()
+    missing = np.isnan(with_missing)
 
     # Handle case of not enough data
     # if everything is missing, can't replace any values
     # If only one value present, set everything to that value
-    num_with_data = len(with_missing) - np.sum(np.isnan(with_missing))
+    num_with_data = len(with_missing) - np.count_nonzero(missing)
     if num_with_data == 0:
         return out
     elif num_with_data == 1:
-        out[np.argwhere(np.isnan(with_missing))] = np.nanmean(with_missing)
+        out[missing] = np.nanmean(with_missing)
         return out
 
-    # For each value in the input vector
-    # check to see if it's missing.
-
-    for i in range(len(with_missing)):
-        if not np.isnan(with_missing[i]):
-            continue
-
-        # Calculate vector of weights for the mean
-        # Default is exponential weights, based on distance from the value in question
-        # Weights = 2**abs(index - i). missing values weighted at 0
-        # Calculate weighted mean of selected values, fill in missing value
-
-        indices = get_indices(with_missing, i, k)
-        weights = calc_weights(with_missing, indices, i)
-        window = with_missing[indices]
-        window = np.nan_to_num(window)  # replace nan with missing to allow for dot product
-        out[i] = window.dot(weights) / np.sum(weights)
+    # Precompute once for the whole vector instead of for every window:
+    # present[j] is the number of non-missing values before index j,
+    # so the number of values with data in a window [lo, hi) is
+    # present[hi] - present[lo]
+    present = np.concatenate(([0], np.cumsum(~missing)))
+    values = np.nan_to_num(with_missing)  # replace nan to allow for dot product
+    n = len(with_missing)
+
+    # For each missing value in the input vector
+    # calculate vector of weights for the mean
+    # Default is exponential weights, based on distance from the value in question
+    # Weights = 2**abs(index - i). missing values weighted at 0
+    # Calculate weighted mean of selected values, fill in missing value
+    # The window is widened until it contains at least
+    # two non-missing values, see ``get_indices``
+
+    for i in np.flatnonzero(missing):
+        w = k
+        while True:
+            lo = max(0, i - w)
+            hi = min(n, i + w + 1)
+            if present[hi] - present[lo] >= 2:
+                break
+            w += 1
+        weights = 1 / 2**np.abs(np.arange(lo, hi) - i)
+        weights[missing[lo:hi]] = 0
+        out[i] = values[lo:hi].dot(weights) / np.sum(weights)
 
     return out
 
@@ -23,12 +23,17 @@ Tester class contains list of tests to run on data. Tests contain a variable nam
 #  limitations under the License.
 #
 
+import os
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum, auto
+from typing import Any, Dict, Iterator, List, Tuple
 import pandas as pd
 import numpy as np
 import yaml
 import logging
 
+from nsaph_utils.utils.yaml_utils import FullLoader
+
 
 class Condition(Enum):
 
@@ -54,6 +59,94 @@ class ExpectationError(Exception):
     pass
 
 
+MAX_WORKERS = max(1, (os.cpu_count() or 1) - 2)
+"""Maximum number of threads running tests concurrently"""
+
+BLOCK_SIZE = 1 << 16
+"""Number of values compared at a time by ``count_where``"""
+
+
+def count_where(values: np.ndarray, op: np.ufunc, val) -> int:
+    """
+    Counts elements of an array for which ``op(element, val)`` is true.
+    See ``count_where_many``
+
+    :param values: column values
+    :param op: comparison ufunc, e.g. ``np.less`` or ``np.greater``
+    :param val: value to compare against
+    :return: number of matching elements
+    """
+
+    return count_where_many(values, [(op, val)])[0]
+
+
+def count_where_many(values: np.ndarray, comparisons: List[Tuple[np.ufunc, Any]]) -> List[int]:
+    """
+    Counts elements of an array satisfying each of several comparisons.
+
+    Numeric arrays are compared block by block into one reusable
+    boolean buffer. Every block is checked against all comparisons
+    while it is still in cache, so the column is read from memory
+    once however many thresholds are tested
+
+    :param values: column values
+    :param comparisons: list of tuples: comparison ufunc
+        (e.g. ``np.less`` or ``np.greater``) and value to compare against
+    :return: number of matching elements for each comparison
+    """
+
+    if values.dtype.kind not in "biuf" or len(values) <= BLOCK_SIZE:
+        return [int(np.count_nonzero(op(values, val))) for op, val in comparisons]
+    buffer = np.empty(BLOCK_SIZE, dtype=bool)
+    counts = [0] * len(comparisons)
+    for start in range(0, len(values), BLOCK_SIZE):
+        block = values[start:start + BLOCK_SIZE]
+        mask = buffer[:len(block)]
+        for i, (op, val) in enumerate(comparisons):
+            op(block, val, out=mask)
+            counts[i] += int(np.count_nonzero(mask))
+    return counts
+
+
+def _missing(values: np.ndarray) -> np.ndarray:
+    if values.dtype.kind == 'f':
+        return np.isnan(values)
+    return pd.isna(values)
+
+
+def count_missing(values: np.ndarray) -> int:
+    """
+    Counts missing values in a column without leaving C code
+
+    :param values: column values
+    :return: number of missing (NaN or None) values
+    """
+
+    return int(np.count_nonzero(_missing(values)))
+
+
+def has_missing(values: np.ndarray) -> bool:
+    """
+    Checks if a column contains at least one missing value.
+    Float arrays are scanned block by block, stopping at the first
+    block with a NaN
+
+    :param values: column values
+    :return: True if there are missing (NaN or None) values
+    """
+
+    if values.dtype.kind != 'f' or len(values) <= BLOCK_SIZE:
+        return bool(_missing(values).any())
+    buffer = np.empty(BLOCK_SIZE, dtype=bool)
+    for start in range(0, len(values), BLOCK_SIZE):
+        block = values[start:start + BLOCK_SIZE]
+        mask = buffer[:len(block)]
+        np.isnan(block, out=mask)
+        if mask.any():
+            return True
+    return False
+
+
 class Test:
 
     def __init__(self, variable, condition, severity, val=None, name=None, logger = None):
@@ -78,6 +171,7 @@ class Test:
 
         self._validate_test()
         self.expectation = self._construct_expectation()
+        self._reducer, self._limit, self._is_share, self._message = self._construct_reducer()
 
 
     def _validate_test(self):
@@ -114,6 +208,43 @@ class Test:
 
 
 
+    def _construct_reducer(self):
+        """
+        Choose once, when the test is created, how ``check`` evaluates it
+
+        :return: a tuple: reducer counting offending values
+            (or None for a data type test), the largest passing count
+            (or share of rows), whether the limit is a share of rows,
+            and a template of the failure message
+        """
+
+        if self.condition == Condition.data_type:
+            return None, None, False, None
+        if self.condition == Condition.count_missing:
+            if 1 > self.val > 0:
+                # assume expectation is a %age
+                template = self.expectation + ". {pct:2.2f}% missing values observed for " + self.variable
+                return _REDUCERS[self.condition], self.val, True, template
+            template = self.expectation + ". {count} missing values observed for " + self.variable
+            return _REDUCERS[self.condition], self.val, False, template
+        template = self.expectation + ". check failed. {pct:2.2f}% of observations with invalid values."
+        return _REDUCERS[self.condition], 1, False, template
+
+    def _check_type(self, column: pd.Series) -> bool:
+        """
+        Checks the type of column values. For NumPy dtypes the answer
+        comes from the column dtype without touching the data. Other
+        dtypes (objects, dates, extension types) are checked by the type of the first value
+
+        :param column: Pandas series
+        :return: True if values are of the expected type
+        """
+
+        dtype = column.dtype
+        if isinstance(dtype, np.dtype) and dtype.kind in "biufc":
+            return self.val in (dtype.name, dtype.type.__name__)
+        return type(column.iat[0]).__name__ == self.val
+
     def check(self, df: pd.DataFrame):
         """
         Check variable of input dataframe to see if it meets conditions
@@ -122,45 +253,107 @@ class Test:
         :return: boolean of if the data passed the test
         """
 
-        message = None
-        result = None
+        if self._reducer is None:
+            return self._check_type(df[self.variable])
+        return self._check_array(df[self.variable].to_numpy(), len(df.index))
 
-        if self.condition == Condition.count_missing:
-            count = sum(np.isnan(df[self.variable]))
-            if 1 > self.val > 0:
-                # assume expectation is a %age
-                result = count/len(df.index) < self.val
-                if not result:
-                    message = self.expectation + ". " + "%2.2f" % (count/len(df.index) * 100) + \
-                              "% missing values observed for " + self.variable
-            else:
-                result = count < self.val
-                if not result:
-                    message = self.expectation + ". " + str(count) + \
-                              " missing values observed for " + self.variable
+    def _check_array(self, values: np.ndarray, n: int) -> bool:
+        """
+        Same as ``check`` for a test with a reducer, but takes
+        the values of the variable already extracted from the data frame
 
-        elif self.condition == Condition.data_type:
-            result = type(df.loc[0, self.variable]).__name__ == self.val
+        :param values: values of the tested variable
+        :param n: number of rows in the data frame
+        :return: boolean of if the data passed the test
+        """
 
-        else:
-            if self.condition == Condition.less_than:
-                count = sum(df[self.variable] > self.val)
-            elif self.condition == Condition.greater_than:
-                count = sum(df[self.variable] < self.val)
-            elif self.condition == Condition.no_missing:
-                count = sum(np.isnan(df[self.variable]))
+        return self._evaluate(self._reducer(values, self.val), n)
+
+    def _evaluate(self, count: int, n: int) -> bool:
+        """
+        Decides if a test passed given the number of offending values
+        and logs the failure
 
-            result = count == 0
+        :param count: number of values violating the condition
+        :param n: number of rows in the data frame
+        :return: boolean of if the data passed the test
+        """
 
-            if not result:
-                message = self.expectation + ". check failed. " + "%2.2f" % (count/len(df.index) * 100) + \
-                          "% of observations with invalid values."
+        share = count / n if n else 0.0
+        if self._is_share:
+            result = share < self._limit
+        else:
+            result = count < self._limit
 
-        if message:
-            self.__logger.log(self.severity.value, message)
+        if not result and self.__logger.isEnabledFor(self.severity.value):
+            pct = share * 100
+            self.__logger.log(self.severity.value, self._message.format(count=count, pct=pct))
         return result
 
 
+_COMPARISONS = {
+    Condition.less_than: np.greater,
+    Condition.greater_than: np.less,
+}
+"""Comparisons selecting values that violate a threshold condition"""
+
+_REDUCERS = {
+    Condition.less_than: lambda values, val: count_where(values, np.greater, val),
+    Condition.greater_than: lambda values, val: count_where(values, np.less, val),
+    Condition.no_missing: lambda values, val: count_missing(values) if has_missing(values) else 0,
+    Condition.count_missing: lambda values, val: count_missing(values),
+}
+"""Functions counting values that violate a condition, by condition"""
+
+
+def _check_frame(t: Test, df: pd.DataFrame) -> List[bool]:
+    return [t.check(df)]
+
+
+def _check_values(tests: List[Test], values: np.ndarray, n: int) -> List[bool]:
+    """
+    Runs tests of one variable. Threshold tests are evaluated together
+    in a single sweep over the values
+
+    :param tests: tests of the same variable
+    :param values: values of the variable
+    :param n: number of rows in the data frame
+    :return: results of the tests, threshold tests first
+    """
+
+    thresholds = [t for t in tests if t.condition in _COMPARISONS]
+    others = [t for t in tests if t.condition not in _COMPARISONS]
+    counts = count_where_many(values, [(_COMPARISONS[t.condition], t.val) for t in thresholds])
+    results = [t._evaluate(count, n) for t, count in zip(thresholds, counts)]
+    results.extend(t._check_array(values, n) for t in others)
+    return results
+
+
+_TEST_LISTS: Dict[Tuple[str, int, int], List[Dict]] = {}
+"""Parsed lists of tests keyed by YAML file path, mtime and size"""
+
+
+def load_test_list(yaml_file: str) -> List[Dict]:
+    """
+    Reads a list of test definitions from a YAML file.
+
+    The parsed list is cached in memory for as long as the YAML file
+    is not modified, so testers created repeatedly from the same file
+    in one process parse it only once
+
+    :param yaml_file: path to YAML file with test definitions
+    :return: list of dictionaries with ``Test`` arguments
+    """
+
+    path = os.path.abspath(yaml_file)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _TEST_LISTS:
+        with open(path) as f:
+            _TEST_LISTS[key] = yaml.load(f, Loader=FullLoader)
+    return [dict(item) for item in _TEST_LISTS[key]]
+
+
 class Tester:
 
     def __init__(self, name, yaml_file=None):
@@ -174,25 +367,83 @@ class Tester:
         self.tests.append(t)
 
     def load_yaml(self, yaml_file):
-        with open(yaml_file) as f:
-            test_list = yaml.load(f, Loader=yaml.FullLoader)
-
-        for item in test_list:
+        for item in load_test_list(yaml_file):
             item['condition'] = Condition[item['condition']]
             item['severity'] = Severity[item['severity']]
             item['logger'] = self._logger
             self.add(Test(**item))
 
-    def check(self, df: pd.DataFrame):
+    def _run(self, df: pd.DataFrame, strict: bool = False) -> Iterator[bool]:
+        """
+        Runs all tests on a data frame. NumPy reductions release the GIL,
+        therefore independent tests run concurrently in a thread pool
+        sharing the same data frame
+
+        :param df: Pandas data frame
+        :param strict: if True, run tests one at a time in the order
+            of the list, so that the caller can stop after the first
+            failure without any other test running or logging
+        :return: results of the tests
+        """
+
+        # Extract every tested column once, as a contiguous array
+        # that block scans read sequentially, and run all tests
+        # of a variable together
+        n = len(df.index)
+        if strict:
+            columns: Dict[str, np.ndarray] = {}
+            for t in self.tests:
+                if t.condition == Condition.data_type:
+                    yield t.check(df)
+                    continue
+                if t.variable not in columns:
+                    columns[t.variable] = np.ascontiguousarray(df[t.variable].to_numpy())
+                yield from _check_values([t], columns[t.variable], n)
+            return
+        by_variable: Dict[str, List[Test]] = {}
+        jobs = []
+        for t in self.tests:
+            if t.condition == Condition.data_type:
+                jobs.append((_check_frame, t, df))
+            else:
+                by_variable.setdefault(t.variable, []).append(t)
+        jobs.extend(
+            (_check_values, tests, np.ascontiguousarray(df[variable].to_numpy()), n)
+            for variable, tests in by_variable.items()
+        )
+
+        workers = min(len(jobs), MAX_WORKERS)
+        if workers < 2:
+            for job, *args in jobs:
+                yield from job(*args)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(*job) for job in jobs]
+            for f in futures:
+                yield from f.result()
+
+    def check(self, df: pd.DataFrame, strict: bool = False):
+        """
+        Runs all tests on a data frame
+
+        :param df: Pandas data frame
+        :param strict: if True, stop on the first failed test in the order
+            of the list. Remaining tests are skipped and do not log anything
+        :return: True if all tests passed
+        """
+
         out = True
         num_tests = 0
         num_failures = 0
-        for t in self.tests:
+        for result in self._run(df, strict):
             num_tests += 1
-            result = t.check(df)
             out = out and result
             if not result:
                 num_failures += 1
+                if strict:
+                    self._logger.info("Tests stopped after the first failure. " +
+                                      str(num_tests) + " of " + str(len(self.tests)) + " tests completed.")
+                    return False
 
         passes = num_tests - num_failures
         self._logger.info("All Tests Completed. Out of " + str(num_tests) + " tests: " +
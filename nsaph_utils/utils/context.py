@@ -23,7 +23,7 @@ Utilities to create context and configuration objects
 import argparse
 import datetime
 from enum import Enum
-from typing import List
+from typing import Dict, List, Tuple
 
 
 class Cardinality(Enum):
@@ -77,31 +77,46 @@ class Argument:
         self.choices = valid_values
         self.required_flag = self.default is None and required
 
+        # Arguments do not change after creation, hence what is passed
+        # to argparse is computed once
+        self._action = self._compute_action()
+        self._nargs = self._compute_nargs()
+        self._help = self._compute_help()
         return
 
-    def get_action(self):
+    def _compute_action(self):
         if self.type == bool:
             if not self.default:
                 return 'store_true'
             return 'store_false'
         return None
 
-    def get_nargs(self):
+    def _compute_nargs(self):
         if self.cardinality == Cardinality.single:
             return None
         if self.default:
             return '*'
         return '+'
 
-    def get_help(self):
+    def _compute_help(self):
         if not self.is_required():
             h = self.description
-            if h.strip() and h.strip()[-1] not in {'.', ','}:
+            stripped = h.strip()
+            if stripped and stripped[-1] not in {'.', ','}:
                 h += ', '
             h += "default: " + str(self.default)
             return h
         return self.description
 
+    def get_action(self):
+        return self._action
+
+    def get_nargs(self):
+        return self._nargs
+
+    def get_help(self):
+        return self._help
+
     def is_required(self):
         return self.required_flag
 
@@ -113,12 +128,12 @@ class Argument:
             else:
                 args.append("--" + alias)
 
-        action = self.get_action()
-        nargs = self.get_nargs()
+        action = self._action
+        nargs = self._nargs
         kwargs = {
             "default": self.default,
-            "help": self.get_help(),
-            "required": self.is_required()
+            "help": self._help,
+            "required": self.required_flag
         }
         if action:
             kwargs['action'] = action
@@ -157,6 +172,9 @@ class Context:
                          default=True,
                          help="Use gzip compression for the result")
 
+    _attrs_cache: Dict[Tuple[type, bool], List[str]] = {}
+    """Names of options defined by a subclass, discovered once per class"""
+
     def __init__(self, subclass,
                  description = None,
                  include_default: bool = True):
@@ -189,16 +207,31 @@ class Context:
         else:
             self.description = subclass.__doc__
 
-        self._attrs = [
-            attr[1:] for attr in subclass.__dict__
-            if attr[0] == '_' and attr[1] != '_'
-        ]
+        key = (subclass, include_default)
+        if key not in Context._attrs_cache:
+            attrs = self._arguments_of(subclass)
+            if include_default:
+                attrs += [
+                    attr for attr in self._arguments_of(Context)
+                    if attr not in attrs
+                ]
+            Context._attrs_cache[key] = attrs
+        self._attrs = list(Context._attrs_cache[key])
+
+    @staticmethod
+    def _arguments_of(cls) -> List[str]:
+        """
+        Finds names of configuration options defined by a class
 
-        if include_default:
-            self._attrs += [
-                attr[1:] for attr in Context.__dict__
-                if attr[0] == '_' and attr[1] != '_' and attr[1:] not in self._attrs
-            ]
+        :param cls: a class defining options as members named
+            ``_<option>`` with instances of :class Argument: as values
+        :return: list of option names
+        """
+
+        return [
+            attr[1:] for attr, value in cls.__dict__.items()
+            if attr[0] == '_' and attr[1] != '_' and isinstance(value, Argument)
+        ]
 
     def instantiate(self):
         self.arguments = [getattr(self, '_'+attr) for attr in self._attrs]
@@ -245,20 +278,18 @@ class Context:
         """
 
         if attr == "years":
-            if type(value) is str:
-                value = [value]
-            years = []
             if isinstance(value, str):
                 value = [value]
+            years = []
+            ordered = True
             for y in value:
-                if ':' in y:
-                    x = y.split(':')
-                    y1 = int(x[0])
-                    y2 = int(x[1])
-                    years += range(y1, y2 + 1)
-                else:
-                    years.append(int(y))
-            return sorted(years)
+                first, sep, last = y.partition(':')
+                y1 = int(first)
+                y2 = int(last) if sep else y1
+                if years and y1 <= years[-1]:
+                    ordered = False
+                years.extend(range(y1, y2 + 1))
+            return years if ordered else sorted(years)
         return value
 
     @classmethod
@@ -29,9 +29,126 @@ therefore a universal parser for FTS files is not feasible to supply.
 """
 
 import logging
+import mmap
 import os
-from typing import List, Tuple
-from dateutil import parser as date_parser
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+
+
+DATE_FORMATS = {
+    8: ("%Y%m%d",),
+    9: ("%d%b%Y",),
+    10: ("%Y-%m-%d", "%m/%d/%Y"),
+}
+"""
+Formats of SAS dates that can be parsed without inferring the format,
+by the length of the value
+"""
+
+
+DATE_CACHE_SIZE = 100000
+"""Maximum number of parsed dates an FWFReader keeps"""
+
+
+def parse_date(value: str) -> datetime:
+    """
+    Parses a date written by SAS. Common fixed width SAS formats
+    (YYMMDDN8, DATE9, YYMMDD10, MMDDYY10) are parsed by
+    datetime.strptime, anything else falls back to dateutil parser,
+    which is imported only when it is needed
+
+    :param value: stripped value of a DATE column
+    :return: parsed date
+    """
+
+    for fmt in DATE_FORMATS.get(len(value), ()):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    from dateutil import parser as date_parser
+    return date_parser.parse(value)
+
+
+NUM, DATE, TEXT = range(3)
+TYPE_IDS = {"NUM": NUM, "DATE": DATE}
+"""Codes of column types, columns of all other types are read as text"""
+
+READ_BLOCK_SIZE = 1 << 20
+"""Approximate size in bytes of a block of records read at once"""
+
+MAX_INT_WIDTH = 18
+"""Widest NUM column that is converted to 64 bit integers in bulk"""
+
+MAX_EOL_LEN = 4
+"""Maximum number of line terminator bytes looked for after a record"""
+
+
+def parse_int(raw: bytes) -> Optional[int]:
+    """
+    Parses a single value of an integer NUM column
+
+    :param raw: raw bytes of the value
+    :return: integer or None if the value is blank
+    """
+
+    # int() accepts bytes and skips surrounding ASCII whitespace itself
+    try:
+        return int(raw)
+    except ValueError:
+        pass
+    val = raw.decode("utf-8").strip()
+    if val:
+        return int(val)
+    return None
+
+
+def _same(value):
+    return value
+
+
+def compile_parser(parsers: List[Callable[[bytes], Any]]) -> Callable[[Tuple], List]:
+    """
+    Generates a function parsing a record with straight-line code:
+    each parser is applied to the value at the same position, and
+    values that are already parsed or only need decoding are inlined
+
+    :param parsers: list of parsers, one per column
+    :return: a function taking a tuple of raw values of a record and
+        returning a list of parsed values
+    """
+
+    namespace = dict()
+    cells = []
+    for i, parser in enumerate(parsers):
+        if parser is _same:
+            cells.append("r[{:d}]".format(i))
+        elif parser is bytes.decode:
+            cells.append("r[{:d}].decode()".format(i))
+        else:
+            namespace["p{:d}".format(i)] = parser
+            cells.append("p{0:d}(r[{0:d}])".format(i))
+    source = "def parse_record(r):\n    return [{}]\n".format(", ".join(cells))
+    exec(compile(source, "<fwf record parser>", "exec"), namespace)
+    return namespace["parse_record"]
+
+
+def parse_ints(values: np.ndarray) -> List[Optional[int]]:
+    """
+    Converts a column of fixed width byte strings to integers at once
+
+    :param values: NumPy array of byte strings (dtype ``S<width>``)
+    :return: list of integers, with None for blank values
+    :raises ValueError: if any non blank value is not an integer
+    """
+
+    blank = np.char.isspace(values) | (values == b"")
+    if not blank.any():
+        return values.astype(np.int64).tolist()
+    ints = np.where(blank, b"0", values).astype(np.int64).tolist()
+    return [None if b else v for v, b in zip(ints, blank.tolist())]
 
 
 class FWFColumn:
@@ -88,13 +205,38 @@ class FWFMeta:
         if (size is not None) and (self.size != size):
             #assert self.size == size
             logging.warning("Size mismatch: expected: {:,}; actual: {:,}"
-                            .format(self.size, size))
+                            .format(size, self.size))
         self.path = path
         '''Physical path to the file on teh file system'''
 
+        with open(path, "rb") as f:
+            f.seek(record_len)
+            head = f.read(MAX_EOL_LEN)
+        self.eol = head[:len(head) - len(head.lstrip(b"\r\n"))]
+        '''Line terminator following the first record'''
+
+        self.eof_len = len(self.eol)
+        '''Length of the line terminator in bytes'''
+
         self.columns = columns
         '''A list of FWFColumn instances, describing each column'''
 
+        # Column attributes used for every record, as parallel tuples
+        self.names = tuple(c.name for c in columns)
+        '''Names of the columns'''
+
+        self.starts = tuple(c.start for c in columns)
+        '''Starting positions of the columns'''
+
+        self.ends = tuple(c.end for c in columns)
+        '''Ending positions of the columns'''
+
+        self.type_ids = tuple(TYPE_IDS.get(c.type, TEXT) for c in columns)
+        '''Codes of column types: NUM, DATE or TEXT for anything else'''
+
+        self.scales = tuple(c.d for c in columns)
+        '''Scales of the columns'''
+
         return
 
 
@@ -125,26 +267,121 @@ class FWFReader:
         '''Number of records that have failed parsing'''
 
         self.nb = 1000
+        '''Number of records read at once, set when the file is opened'''
+
+        self._buffer = None
+        self._block_size = 0
+        self._mmap = None
+        self._view = None
+        self._offset = 0
         self.nr = 0
         self.b = 0
         self.record_start_pos = 0
-        self.eof_len = None
+        self.eof_len = meta.eof_len
+        self._eol = meta.eol
+
+        self.records = []
+        '''Raw column values of the records in the current block'''
+
+        self.parsed = ()
+        '''For each column, whether it has been parsed for the whole block'''
+
+        self.nparsed = 0
+        '''Number of records in the block with parsed columns'''
+
+        self._dtype = None
+        self._parsers = []
+        self._block_parsers = []
+        self._parse_record = None
+        self._parse_block_record = None
+        self._compiled = dict()
+        self._int_columns = set()
+        self._date_cache = dict()
+        '''Parsed dates by raw, not decoded, values of DATE columns'''
 
     def column_names(self) -> List[str]:
-        return [c.name for c in self.metadata.columns]
+        return list(self.metadata.names)
 
     def open(self):
         if self.input is not None:
             return
-        if self.eof_len is None:
-            with open(self.metadata.path, "rb") as f:
-                b = f.read(self.metadata.rlen)
-                self.eof_len = 0
-                while f.read(1)[0] in [10, 13]:
-                    self.eof_len += 1
-        self.input = open(self.metadata.path, "rb")
+        self.input = open(self.metadata.path, "rb", buffering=0)
+        size = os.fstat(self.input.fileno()).st_size
+        if size != self.metadata.size:
+            logging.warning("File {} has changed size since its metadata was "
+                            "created: {:,} bytes instead of {:,}"
+                            .format(self.metadata.path, size, self.metadata.size))
+        self._dtype = self._record_dtype()
+        self._parsers = [self._make_parser(i) for i in range(self.metadata.ncol)]
+        self._parse_record = compile_parser(self._parsers)
+        self._compiled = dict()
+        self._int_columns = {
+            i for i, c in enumerate(self.metadata.columns)
+            if c.type == "NUM" and not c.d and c.length <= MAX_INT_WIDTH
+        }
+        stride = self.metadata.rlen + self.eof_len
+        self.nb = max(1, READ_BLOCK_SIZE // stride)
+        self._block_size = stride * self.nb
+        self._offset = 0
+        try:
+            self._mmap = mmap.mmap(self.input.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(self._mmap, "madvise"):
+                self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+            self._view = memoryview(self._mmap)
+            return
+        except (ValueError, OSError):
+            # Empty files and files that cannot be mapped are read
+            # into a buffer
+            self._mmap = None
+        self._buffer = bytearray(self._block_size)
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(self.input.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def _prefetch(self, start: int):
+        """
+        Asks the kernel to start reading the block following
+        the current one, so that I/O overlaps with parsing
+
+        :param start: offset of the next block in the file
+        """
+
+        if start >= len(self._view) or not hasattr(mmap, "MADV_WILLNEED"):
+            return
+        aligned = start - start % mmap.PAGESIZE
+        length = min(self._block_size + start - aligned, len(self._view) - aligned)
+        self._mmap.madvise(mmap.MADV_WILLNEED, aligned, length)
+
+    def _read_block(self) -> memoryview:
+        """
+        Returns the next block of records. For a memory mapped file,
+        this is a view of the mapping, otherwise the data is read
+        into the reusable buffer
+
+        :return: a view of the data, empty at the end of the file
+        """
+
+        if self._mmap is not None:
+            start = self._offset
+            self._offset = min(start + self._block_size, len(self._view))
+            self._prefetch(self._offset)
+            return self._view[start:self._offset]
+        view = memoryview(self._buffer)
+        size = 0
+        while size < len(view):
+            n = self.input.readinto(view[size:])
+            if not n:
+                break
+            size += n
+        return view[:size]
 
     def close(self):
+        if self._mmap is not None:
+            # Views must be released before the mapping can be closed
+            if self.data is not None:
+                self.data.release()
+            self._view.release()
+            self._mmap.close()
+            self._mmap = None
         if self.input is not None:
             self.input.close()
         return
@@ -168,84 +405,200 @@ class FWFReader:
     def __str__(self):
         return super().__str__() + ": " + self.metadata.path
 
+    def _record_dtype(self):
+        """
+        Builds a NumPy structured type that lays the columns of a record
+        over the raw bytes of the file, including the line terminator
+
+        :return: structured dtype or None if some columns do not fit
+            into the record
+        """
+
+        rlen = self.metadata.rlen
+        bounds = list(zip(self.metadata.starts, self.metadata.ends))
+        if not bounds or any(not 0 <= s < e <= rlen for s, e in bounds):
+            return None
+        return np.dtype({
+            "names": ["f{:d}".format(i) for i in range(len(bounds))],
+            "formats": ["V{:d}".format(e - s) for s, e in bounds],
+            "offsets": list(self.metadata.starts),
+            "itemsize": rlen + self.eof_len
+        })
+
+    def _split(self, data: memoryview) -> List[Tuple[bytes, ...]]:
+        """
+        Splits a block of records into raw column values. Complete
+        records are split by NumPy in one call, column by column,
+        an incomplete record at the end of the file is split by slicing
+
+        :param data: a block of data read from the file
+        :return: list of records, each record is a tuple of bytes
+        """
+
+        rlen = self.metadata.rlen
+        stride = rlen + self.eof_len
+        n = len(data) // stride
+        parsed = [False] * self.metadata.ncol
+        if self._dtype is not None and n > 0:
+            block = np.frombuffer(data, dtype=self._dtype, count=n)
+            self._check_terminators(data, n)
+            values = []
+            for i, f in enumerate(self._dtype.names):
+                if i in self._int_columns:
+                    try:
+                        width = self._dtype.fields[f][0].itemsize
+                        values.append(parse_ints(block[f].view("S{:d}".format(width))))
+                        parsed[i] = True
+                        continue
+                    except (ValueError, OverflowError):
+                        # Let read_record report bad values
+                        pass
+                values.append(block[f].tolist())
+            records = list(zip(*values))
+        else:
+            records = []
+            n = 0
+        self.parsed = tuple(parsed)
+        self.nparsed = n
+        self._block_parsers = [
+            _same if parsed[i] else parser for i, parser in enumerate(self._parsers)
+        ]
+        if self.parsed not in self._compiled:
+            self._compiled[self.parsed] = compile_parser(self._block_parsers)
+        self._parse_block_record = self._compiled[self.parsed]
+        bounds = list(zip(self.metadata.starts, self.metadata.ends))
+        for pos in range(n * stride, len(data), stride):
+            record = bytes(data[pos:pos + rlen])
+            if len(record) < rlen:
+                logging.warning(
+                    "Incomplete record at the end of {}: {:d} bytes instead of {:d}, "
+                    "ignored".format(self.metadata.path, len(record), rlen)
+                )
+                break
+            records.append(tuple(record[s:e] for s, e in bounds))
+        return records
+
+    def _check_terminators(self, data: memoryview, n: int):
+        """
+        Verifies that every one of the first n records in the block
+        is followed by the same line terminator as the first record
+        in the file. Records are located by fixed stride
+        arithmetic, a mismatch means that record length
+        in the metadata does not match the file
+
+        :param data: a block of data read from the file
+        :param n: number of complete records in the block
+        """
+
+        if not self._eol:
+            return
+        rlen = self.metadata.rlen
+        stride = rlen + self.eof_len
+        chars = np.frombuffer(data, dtype=np.uint8, count=n * stride)
+        terminators = chars.reshape(n, stride)[:, rlen:]
+        bad = np.flatnonzero(
+            (terminators != np.frombuffer(self._eol, dtype=np.uint8)).any(axis=1)
+        )
+        if len(bad) > 0:
+            logging.warning(
+                "Line terminator expected after record {:d}: {:d} records in "
+                "block are misaligned".format(self.line + int(bad[0]) + 1, len(bad))
+            )
+
+    def _make_parser(self, i: int) -> Callable[[bytes], Any]:
+        """
+        Chooses a function converting raw bytes of a column to a value
+
+        :param i: index of the column
+        :return: parser for the column
+        """
+
+        t = self.metadata.type_ids[i]
+        if t == NUM and not self.metadata.scales[i]:
+            return parse_int
+        if t == DATE:
+            return self._parse_date
+        return bytes.decode
+
+    def _parse_date(self, raw: bytes) -> Optional[datetime]:
+        # the same dates repeat across many records
+        try:
+            return self._date_cache[raw]
+        except KeyError:
+            pass
+        v = raw.decode("utf-8").strip()
+        if v:
+        #     if len(v) == len(s) - 2:
+        #         v = v + '01'
+        #     elif len(v) == len(s) - 4:
+        #         v = v + '0101'
+            value = parse_date(v)
+        else:
+            value = None
+        if len(self._date_cache) >= DATE_CACHE_SIZE:
+            self._date_cache.clear()
+        self._date_cache[raw] = value
+        return value
+
     def read_record(self):
-        i1 = self.record_start_pos + self.metadata.rlen
-        data = self.data[self.record_start_pos:i1]
-        while i1 < len(self.data) and self.data[i1] in [10, 13]:
-            i1 += 1
-        self.record_start_pos = i1
+        # Position of the record in the current block
+        pos = self.record_start_pos
+        pieces = self.records[pos]
+        self.record_start_pos = pos + 1
+        if pos < self.nparsed:
+            parsers = self._block_parsers
+            parse_record = self._parse_block_record
+        else:
+            parsers = self._parsers
+            parse_record = self._parse_record
+        try:
+            return parse_record(pieces)
+        except Exception:
+            # Parse the record again cell by cell to report bad values
+            pass
+
+        meta = self.metadata
         exception_count = 0
-        pieces = []
-        n = len(self.metadata.columns)
-        for c in self.metadata.columns:
+        record = [None] * meta.ncol
+        for i in range(meta.ncol):
             try:
-                pieces.append(data[c.start:c.end])
-            except:
-                raise
-        record = []
-        for i in range(n):
-            column = self.metadata.columns[i]
-            s = pieces[i].decode("utf-8")
-            try:
-                if column.type == "NUM" and not column.d:
-                    val = s.strip()
-                    if val:
-                        record.append(int(val))
-                    else:
-                        record.append(None)
-                elif column.type == "DATE":
-                    v = s.strip()
-                    if v:
-                    #     if len(v) == len(s) - 2:
-                    #         v = v + '01'
-                    #     elif len(v) == len(s) - 4:
-                    #         v = v + '0101'
-                         record.append(date_parser.parse(v))
-                    else:
-                        record.append(None)
-                else:
-                    record.append(s)
+                record[i] = parsers[i](pieces[i])
             except Exception as x:
+                column = meta.columns[i]
                 logging.exception("{:d}: {}[{:d}]: - {}".format(
                     self.line, column.name, column.ord, str(x))
                 )
-                record.append(s)
+                record[i] = pieces[i].decode("utf-8")
                 exception_count += 1
                 if exception_count > 3:
-                    logging.error(data)
+                    stride = meta.rlen + self.eof_len
+                    logging.error(bytes(self.data[pos * stride:pos * stride + meta.rlen]))
                     raise FTSParseException("Too meany exceptions", column.start)
         return record
 
     def next(self):
         if self.data is None or self.b >= self.nr:
-            rlen = self.metadata.rlen + self.eof_len
-            # +2 for '\r\n'
-            self.data = self.input.read(rlen * self.nb)
+            self.data = self._read_block()
             if len(self.data) == 0:
                 raise StopIteration()
-            self.nr = len(self.data) / rlen
+            self.records = self._split(self.data)
+            self.nr = len(self.records)
+            if self.nr == 0:
+                raise StopIteration()
             self.b = 0
             self.record_start_pos = 0
+        self.line += 1
+        self.b += 1
         try:
-            self.line += 1
-            self.b += 1
             record = self.read_record()
-            self.good_lines += 1
         except FTSParseException as x:
             logging.exception("Line = " + str(self.line) + ':' + str(x.pos))
             self.bad_lines += 1
             self.on_parse_exception()
             return None
-        except AssertionError as x:
-            logging.exception("Line = " + str(self.line))
-            self.bad_lines += 1
-            self.on_parse_exception()
-            return None
+        self.good_lines += 1
         if self.rdict:
-            record = {
-                self.metadata.columns[i].name:
-                    record[i] for i in range(self.metadata.ncol)
-            }
+            record = dict(zip(self.metadata.names, record))
         return record
 
     def on_parse_exception(self):
@@ -17,33 +17,118 @@
 #  limitations under the License.
 #
 
+import atexit
 import codecs
+import collections
 import csv
 import datetime
-import glob
+import functools
 import gzip
 import io
+import itertools
 import json
 import logging
+import operator
 import os
+import re
+import shutil
+import subprocess
 import tarfile
 import tempfile
+import threading
+import time
 import zipfile
-from datetime import datetime, timezone
-from typing import IO, List, Tuple, Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import IO, Iterable, List, Tuple, Callable
 from abc import ABC, abstractmethod
+from collections.abc import MutableMapping
 
 import requests
 import yaml
 from dateutil.parser import parse
+from requests.adapters import HTTPAdapter
 from requests.models import Response
+from urllib3.util.retry import Retry
 from rpy2.robjects import DataFrame, NA_Logical, NA_Real, NA_Integer, \
     NA_Character, NA_Complex
 
 from nsaph_utils.utils.pyfst import vector2list, FSTReader
+from nsaph_utils.utils.yaml_utils import SafeLoader
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # ISA-L based implementation, much faster deflate and inflate
+    from isal import igzip as _gzip
+except ImportError:
+    _gzip = gzip
+
+try:
+    import rapidgzip
+except ImportError:
+    rapidgzip = None
+
+try:
+    from stream_unzip import stream_unzip
+except ImportError:
+    stream_unzip = None
 
 logger = logging.getLogger(__name__)
 
+MAX_CONCURRENT_REQUESTS = 8
+# Number of hosts to keep connection pools for
+HTTP_POOL_HOSTS = 16
+# Maximum number of connections kept per host
+HTTP_POOL_SIZE = 32
+HTTP_RETRIES = 3
+DOWNLOAD_CHUNK_SIZE = 1048576
+DOWNLOAD_BUFFER_SIZE = 8 * DOWNLOAD_CHUNK_SIZE
+PROGRESS_STEP = 64 * DOWNLOAD_CHUNK_SIZE
+# Seconds for which metadata of remote content is reused
+REMOTE_META_TTL = 60
+# Number of byte ranges of one URL downloaded concurrently
+RANGE_DOWNLOAD_PARTS = 6
+# Content smaller than this is downloaded with a single request
+MIN_RANGE_DOWNLOAD_SIZE = 16 * DOWNLOAD_CHUNK_SIZE
+GZ_BUFFER_SIZE = 256 * 1024
+# Compressed files at least this big are decompressed in parallel,
+# when rapidgzip is available
+PARALLEL_GZ_MIN_SIZE = 64 * 1024 * 1024
+PARALLEL_GZ_BUFFER_SIZE = 8 * 1024 * 1024
+# Compression level of gzip files written by fopen, unless overridden
+# by NSAPH_GZIP_LEVEL environment variable. Fast compression
+# is preferred, as most of these files are intermediate pipeline data
+GZIP_COMPRESS_LEVEL = 1
+PIGZ = shutil.which("pigz")
+
+
+def _create_session() -> requests.Session:
+    """
+    Creates HTTP session keeping connections alive between requests,
+    with a connection pool large enough for concurrent downloads.
+    Failed connections are retried with exponential backoff.
+    Compressed transfer encoding, including Brotli when the brotli
+    package is installed, is negotiated by requests itself
+    """
+
+    session = requests.Session()
+    retry = Retry(total=HTTP_RETRIES, backoff_factor=0.5)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS,
+                          pool_maxsize=HTTP_POOL_SIZE,
+                          max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_SESSION = _create_session()
+atexit.register(_SESSION.close)
+
 
 def sizeof_fmt(num, suffix="B") -> str:
     if num is None:
@@ -74,6 +159,7 @@ class DownloadTask:
 
     def reset(self):
         os.remove(self.destination)
+        save_etags(self.destination, None)
 
     def __str__(self):
         dest = os.path.abspath(self.destination)
@@ -84,16 +170,92 @@ class DownloadTask:
     def is_up_to_date(self, is_transformed: bool = True):
         if len(self.urls) == 1 and not is_transformed:
             return is_downloaded(self.urls[0], self.destination)
-        for url in self.urls:
-            if not is_downloaded(url, self.destination, 1000):
-                return False
-        return True
+        if not os.path.isfile(self.destination):
+            return False
+        # The same URL has to be checked only once
+        urls = list(dict.fromkeys(self.urls))
+        if len(urls) < 2:
+            for url in urls:
+                if not is_downloaded(url, self.destination, 1000):
+                    return False
+            return True
+        # HEAD requests are independent, send them concurrently
+        workers = min(MAX_CONCURRENT_REQUESTS, len(urls))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            checks = executor.map(
+                lambda url: is_downloaded(url, self.destination, 1000),
+                urls
+            )
+            return all(list(checks))
+
+    def download(self, resume: bool = False):
+        """
+        Downloads content of all URLs of the task, in order, into
+        the destination file
+
+        :param resume: for a task with a single URL, continue a previous
+            partial download instead of starting from scratch, if its
+            recorded ETag or modification time shows that it is a part
+            of the current content. Nothing is downloaded if the
+            destination is already up to date
+        """
+
+        if resume and len(self.urls) == 1 and os.path.isfile(self.destination):
+            url = self.urls[0]
+            if is_downloaded(url, self.destination):
+                return
+            known = load_etags(self.destination).get(url)
+            validator = known or _last_modified_validator(url, self.destination)
+            if validator:
+                # Not opened for appending: if the server sends the whole
+                # content, it is written in ranges at their offsets
+                with open(self.destination, "r+b") as to:
+                    to.seek(0, os.SEEK_END)
+                    etag = download(url, to, resume=True, if_range=validator)
+                save_etags(self.destination, {url: etag or known})
+                return
+            # Partial content cannot be validated, download everything
+        # Until the new content is complete, the recorded ETags
+        # must not vouch for the destination
+        save_etags(self.destination, None)
+        if len(self.urls) > 1:
+            etags = download_many(self.urls, self.destination)
+        else:
+            etags = dict()
+            with open(self.destination, "wb") as to:
+                for url in self.urls:
+                    etag = download(url, to)
+                    if etag:
+                        etags[url] = etag
+        save_etags(self.destination, etags)
+
+
+def download_all(tasks: List[DownloadTask],
+                 max_workers: int = MAX_CONCURRENT_REQUESTS):
+    """
+    Downloads several tasks concurrently. Each task writes to its own
+    destination, URLs within a task are fetched in order
+
+    :param tasks: a list of DownloadTask instances
+    :param max_workers: maximum number of simultaneous downloads
+    :return: nothing, raises the first exception encountered
+    """
+
+    if not tasks:
+        return
+    workers = max(1, min(max_workers, len(tasks)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(DownloadTask.download, tasks):
+            pass
 
 
 def as_stream(url: str, extension: str = ".csv", params = None, mode = None):
     """
     Returns the content of URL as a stream. In case the content is in zip
-    format (excluding gzip) creates a temporary file
+    format (excluding gzip), the entry is read from the remote archive
+    with byte range requests when the server supports them, otherwise
+    the archive is streamed or, as the last resort, downloaded into
+    a temporary file
 
     :param mode: optional parameter to specify desirable mode: text or binary.
          Possible values: 't' or 'b'
@@ -105,25 +267,146 @@ def as_stream(url: str, extension: str = ".csv", params = None, mode = None):
     :return: Content of the URL or a zip entry
     """
 
-    response = requests.get(url, stream=True, params=params)
+    if url.lower().endswith(".zip"):
+        entry = _zip_entry_stream(url, extension, params)
+        return io.TextIOWrapper(entry, encoding="utf-8")
+    response = _SESSION.get(url, stream=True, params=params)
     check_http_response(response)
     raw = response.raw
-    if url.lower().endswith(".zip"):
-        tfile = tempfile.TemporaryFile()
-        download(url, tfile)
+    if mode == 't':
+        stream = io.TextIOWrapper(raw)
+    else:
+        stream = raw
+    return stream
+
+
+def _zip_entry_stream(url: str, extension: str, params = None) -> IO:
+    """
+    Returns binary stream with the content of the only entry
+    with the given extension in a remote zip archive
+    """
+
+    size = _get_range_size(url, params)
+    if size:
+        remote = io.BufferedReader(HttpRangeFile(url, size, params),
+                                   buffer_size=DOWNLOAD_CHUNK_SIZE)
+        zfile = zipfile.ZipFile(remote)
+    elif stream_unzip is not None:
+        response = _SESSION.get(url, stream=True, params=params)
+        check_http_response(response)
+        return _stream_zip_entry(response, extension)
+    else:
+        tfile = tempfile.TemporaryFile(buffering=DOWNLOAD_BUFFER_SIZE)
+        # Ranges are not supported, the archive is fetched with
+        # a single request
+        response = _SESSION.get(url, stream=True, params=params)
+        check_http_response(response)
+        _write_content(response, tfile)
         tfile.seek(0)
         zfile = zipfile.ZipFile(tfile)
-        entries = [
-            e for e in zfile.namelist() if e.endswith(extension)
-        ]
-        assert len(entries) == 1
-        stream = io.TextIOWrapper(zfile.open(entries[0]))
-    else:
-        if mode == 't':
-            stream = io.TextIOWrapper(raw)
+    entries = [
+        e for e in zfile.namelist() if e.endswith(extension)
+    ]
+    assert len(entries) == 1
+    # Entry is decompressed in big blocks
+    return io.BufferedReader(zfile.open(entries[0]),
+                             buffer_size=DOWNLOAD_CHUNK_SIZE)
+
+
+def _stream_zip_entry(response: Response, extension: str) -> IO:
+    """
+    Decodes zip archive while it is being downloaded and returns
+    the first entry with the given extension
+    """
+
+    chunks = response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
+    for name, _, content in stream_unzip(chunks):
+        if name.decode("utf-8").endswith(extension):
+            return io.BufferedReader(_IteratorStream(content),
+                                     buffer_size=DOWNLOAD_CHUNK_SIZE)
+        for _ in content:
+            # Entries have to be consumed before moving to the next one
+            pass
+    raise Exception("No entry with extension {} in {}"
+                    .format(extension, response.url))
+
+
+class HttpRangeFile(io.RawIOBase):
+    """
+    Read-only seekable file-like object over a remote resource.
+    Every read is fetched with an HTTP byte range request,
+    the server must accept byte ranges
+    """
+
+    def __init__(self, url: str, size: int, params = None):
+        super().__init__()
+        self.url = url
+        self.size = size
+        self.params = params
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
         else:
-            stream = raw
-    return stream
+            raise ValueError("Invalid whence: {}".format(whence))
+        if position < 0:
+            raise ValueError("Negative seek position {:d}".format(position))
+        self.position = position
+        return position
+
+    def readinto(self, b) -> int:
+        if self.position >= self.size:
+            return 0
+        end = min(self.position + len(b), self.size)
+        response = _SESSION.get(self.url, params=self.params,
+                                headers=_range_header(self.position, end))
+        check_http_response(response)
+        if response.status_code != 206:
+            raise Exception("Server ignored Range request for " + self.url)
+        data = response.content
+        n = len(data)
+        b[:n] = data
+        self.position += n
+        return n
+
+
+class _IteratorStream(io.RawIOBase):
+    """
+    Readable stream over an iterator of byte chunks
+    """
+
+    def __init__(self, chunks):
+        super().__init__()
+        self.chunks = iter(chunks)
+        self.pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self.pending:
+            self.pending = next(self.chunks, None)
+            if self.pending is None:
+                self.pending = b""
+                return 0
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
 
 
 def as_content(url: str, params = None, mode = None):
@@ -138,7 +421,7 @@ def as_content(url: str, params = None, mode = None):
     :return:  Content of the URL
     """
 
-    response = requests.get(url, params=params)
+    response = _SESSION.get(url, params=params)
     check_http_response(response)
     if mode == 't':
         return response.text
@@ -158,6 +441,62 @@ def as_csv_reader(url: str):
     return reader
 
 
+def as_csv_row_reader(url: str) -> Tuple[List[str], csv.reader]:
+    """
+    An utility method to return the CSV content of the URL as
+    rows of values rather than mappings, which is faster for
+    large content
+
+    :param url: URL
+    :return: a tuple with the header row and an instance of csv.reader
+        positioned on the first data row
+    """
+    stream = as_stream(url)
+    reader = csv.reader(stream, quotechar='"', delimiter=',',
+        quoting=csv.QUOTE_NONNUMERIC, skipinitialspace=True)
+    header = next(reader, [])
+    return header, reader
+
+
+def as_csv_record_reader(url: str) -> Iterable[tuple]:
+    """
+    An utility method to return the CSV content of the URL as named
+    tuples. The tuple type is created once from the header, so values
+    are accessed by attribute or by index without building a mapping
+    for every row. Column names that are not valid identifiers are
+    converted, e.g. spaces and punctuation are replaced by underscores
+
+    :param url: URL
+    :return: an iterable over rows as named tuples; the type of
+        the tuples is available as its ``Row`` attribute
+    """
+    header, reader = as_csv_row_reader(url)
+    return _CSVRecords(header, reader)
+
+
+class _CSVRecords:
+    def __init__(self, header: List[str], reader):
+        names = [re.sub(r"\W", "_", str(h)) for h in header]
+        self.Row = collections.namedtuple("Row", names, rename=True)
+        self.reader = reader
+        self.width = len(header)
+
+    def __iter__(self):
+        make = self.Row._make
+        width = self.width
+        for row in self.reader:
+            if len(row) == width:
+                yield make(row)
+            elif not row:
+                # Same as csv.DictReader, empty rows are skipped
+                continue
+            elif len(row) < width:
+                yield make(row + [None] * (width - len(row)))
+            else:
+                raise ValueError("Line {:d} has {:d} values, header has {:d}"
+                                 .format(self.reader.line_num, len(row), width))
+
+
 def file_as_stream(filename: str, extension: str = ".csv", mode=None):
     """
     Returns the content of file as a stream. In case the content is in zip
@@ -212,6 +551,11 @@ def fopen(path: str, mode: str):
     """
     A wrapper to open various types of files
 
+    Gzipped files (``.gz``) are opened with a buffer of GZ_BUFFER_SIZE
+    between the caller and the compressor, so that row-by-row writes,
+    e.g. by csv writers, are compressed in large batches rather than
+    on each call. Text modes are UTF-8 encoded in both cases.
+
     :param path: Path to file
     :param mode: Opening mode
     :return: file-like object
@@ -219,13 +563,136 @@ def fopen(path: str, mode: str):
     if isinstance(path, io.BufferedReader):
         return codecs.getreader("utf-8")(path)
     if path.lower().endswith(".gz"):
-        #return io.TextIOWrapper(gzip.open(path, mode))
-        return gzip.open(path, mode)
+        return _gzip_open(path, mode)
     if 'b' in mode:
         return open(path, mode)
     return open(path, mode, encoding="utf-8")
 
 
+def _gzip_open(path: str, mode: str, parallel: bool = False):
+    """
+    Opens gzip file with a large buffer layered on top of it, so that
+    compression and decompression are done in big blocks.
+    Uses ISA-L (python-isal) when it is installed and, for reading
+    large files, parallel decompression with rapidgzip
+
+    :param parallel: when writing, compress with pigz on all cores
+        if pigz executable is available
+    """
+
+    binary_mode = mode.replace('t', '')
+    if 'b' not in binary_mode:
+        binary_mode += 'b'
+    if binary_mode == 'rb' and _is_parallel_gz(path):
+        buffered = _open_parallel_gz(path)
+        if buffered is not None:
+            if 't' not in mode:
+                return buffered
+            return io.TextIOWrapper(buffered, encoding="utf-8")
+    if 'r' in binary_mode:
+        raw = _gzip.open(path, binary_mode)
+    elif parallel and PIGZ is not None:
+        raw = _PigzWriter(path, 'a' in binary_mode)
+    else:
+        raw = _gzip.open(path, binary_mode, compresslevel=_compress_level())
+    if 'r' in binary_mode:
+        buffered = io.BufferedReader(raw, buffer_size=GZ_BUFFER_SIZE)
+    else:
+        buffered = io.BufferedWriter(raw, buffer_size=GZ_BUFFER_SIZE)
+    if 't' not in mode:
+        return buffered
+    return io.TextIOWrapper(buffered, encoding="utf-8", write_through=False)
+
+
+class _PigzWriter(io.RawIOBase):
+    """
+    Writable stream compressing its content into a gzip file
+    with pigz, a parallel implementation of gzip
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        super().__init__()
+        self.out = open(path, "ab" if append else "wb")
+        self.process = subprocess.Popen(
+            [PIGZ, "-c", "-{:d}".format(_gzip_level()),
+             "-p", str(os.cpu_count() or 1)],
+            stdin=subprocess.PIPE, stdout=self.out
+        )
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.process.stdin.write(b)
+        return len(b)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.process.stdin.close()
+            code = self.process.wait()
+        finally:
+            self.out.close()
+            super().close()
+        if code != 0:
+            raise Exception("pigz exited with code {:d}".format(code))
+
+
+def _open_parallel_gz(path: str):
+    """
+    Opens gzip file for reading with parallel decompression. Half of
+    the cores are used, leaving the rest for the consumer of the data.
+    Returns None if rapidgzip cannot open the file
+    """
+
+    threads = max(1, (os.cpu_count() or 1) // 2)
+    try:
+        raw = rapidgzip.open(path, parallelization=threads)
+    except Exception as e:
+        logger.warning("Falling back to sequential decompression of %s: %s",
+                       path, e)
+        return None
+    return io.BufferedReader(raw, buffer_size=PARALLEL_GZ_BUFFER_SIZE)
+
+
+def _gzip_level() -> int:
+    return _parse_gzip_level(os.environ.get("NSAPH_GZIP_LEVEL"))
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_gzip_level(value: str) -> int:
+    # Cached, so that an invalid value is reported only once
+    if value is None:
+        return GZIP_COMPRESS_LEVEL
+    try:
+        level = int(value)
+    except ValueError:
+        level = -1
+    if not 0 <= level <= 9:
+        logger.warning("Invalid NSAPH_GZIP_LEVEL: '{}', using {:d}"
+                       .format(value, GZIP_COMPRESS_LEVEL))
+        return GZIP_COMPRESS_LEVEL
+    return level
+
+
+def _compress_level() -> int:
+    level = _gzip_level()
+    if _gzip is gzip:
+        return level
+    # ISA-L supports levels from 0 to 3
+    return min(level, 3)
+
+
+def _is_parallel_gz(path: str) -> bool:
+    if rapidgzip is None:
+        return False
+    try:
+        return os.path.getsize(path) >= PARALLEL_GZ_MIN_SIZE
+    except OSError:
+        return False
+
+
 def check_http_response(r: Response):
     """
     An internal method raises an exception of HTTP response is not OK
@@ -241,14 +708,345 @@ def check_http_response(r: Response):
         raise Exception(msg)
 
 
-def download(url: str, to: IO):
-    """An utility method to download large binary data to a file-like object"""
-    response = requests.get(url, stream=True)
-    for chunk in response.iter_content(chunk_size=1048576):
-        to.write(chunk)
-        print('#', end='')
+def download(url: str, to: IO, resume: bool = False, if_range: str = None):
+    """
+    An utility method to download large binary data to a file-like object.
+
+    If the destination is seekable and the server accepts byte ranges,
+    the content is fetched by several parallel range requests, each
+    writing its own part of the destination. Otherwise, the content
+    is streamed with a single request.
+
+    :param url: URL
+    :param to: destination
+    :param resume: If True, the destination must contain nothing but
+        a part of the content of this URL, positioned at its end.
+        Only the rest of the content is requested, provided that
+        ``if_range`` is given. If the server sends the whole content
+        instead, or without ``if_range``, the destination is rewritten
+    :param if_range: ETag or Last-Modified date of the content already
+        in the destination; if the content has changed since,
+        the server returns all of it
+    :return: ETag of the downloaded content, if the server has sent one
+    """
+
+    if resume and to.tell() > 0:
+        if if_range:
+            return _resume_download(url, to, if_range)
+        to.seek(0)
+        to.truncate()
+    size = _get_range_download_size(url, to)
+    if size:
+        response = _SESSION.get(url, stream=True,
+                                headers=_range_header(0, _part_size(size)))
+        check_http_response(response)
+        if response.status_code == 206:
+            _download_ranges(url, to, size, response)
+            print('.', end=' ')
+            return response.headers.get('ETag')
+    else:
+        response = _SESSION.get(url, stream=True)
+    # Server has returned the whole content
+    _write_content(response, to)
     print('.', end=' ')
-    return
+    return response.headers.get('ETag')
+
+
+def _resume_download(url: str, to: IO, if_range: str):
+    start = to.tell()
+    headers = {"Range": "bytes={:d}-".format(start), "If-Range": if_range}
+    response = _SESSION.get(url, stream=True, headers=headers)
+    if response.status_code == 416:
+        response.close()
+        match = re.fullmatch(r"bytes\s+\*/(\d+)",
+                             response.headers.get('Content-Range', '').strip())
+        if match and int(match.group(1)) == start:
+            # Nothing is left to download
+            print('.', end=' ')
+            return response.headers.get('ETag')
+        # The destination does not hold a part of the current content
+        to.seek(0)
+        to.truncate()
+        return download(url, to)
+    check_http_response(response)
+    if response.status_code != 206:
+        # Server has returned the whole content
+        to.seek(0)
+        to.truncate()
+    _write_content(response, to)
+    print('.', end=' ')
+    return response.headers.get('ETag')
+
+
+def download_many(urls: List[str], destination: str,
+                  max_workers: int = MAX_CONCURRENT_REQUESTS) -> dict:
+    """
+    Downloads content of several URLs, concatenated in the given order,
+    into one file. When sizes of all URLs are known in advance,
+    the URLs are fetched concurrently and each is written directly
+    at its offset in the destination file. Otherwise, they are
+    downloaded one after another
+
+    :param urls: list of URLs
+    :param destination: path to the destination file
+    :param max_workers: maximum number of simultaneous downloads
+    :return: a dictionary mapping URLs to ETags sent by the server
+    """
+
+    workers = max(1, min(max_workers, len(urls)))
+    sizes = []
+    if hasattr(os, "pwrite") and len(urls) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            sizes = list(executor.map(_get_content_size, urls))
+    etags = dict()
+    if not sizes or not all(sizes):
+        with open(destination, "wb") as to:
+            for url in urls:
+                etag = download(url, to)
+                if etag:
+                    etags[url] = etag
+        return etags
+
+    offsets = [0]
+    for size in sizes[:-1]:
+        offsets.append(offsets[-1] + size)
+    fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+
+    def fetch(i: int):
+        url = urls[i]
+        response = _SESSION.get(url, stream=True)
+        check_http_response(response)
+        position = offsets[i]
+        end = position + sizes[i]
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            if position + len(chunk) > end:
+                raise Exception("Content of {} is larger than {:d} bytes"
+                                .format(url, sizes[i]))
+            os.pwrite(fd, chunk, position)
+            position += len(chunk)
+            print('#', end='')
+        if position != end:
+            raise Exception("Content of {} is shorter than {:d} bytes"
+                            .format(url, sizes[i]))
+        return response.headers.get('ETag')
+
+    try:
+        os.ftruncate(fd, offsets[-1] + sizes[-1])
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for url, etag in zip(urls, executor.map(fetch, range(len(urls)))):
+                if etag:
+                    etags[url] = etag
+    finally:
+        os.close(fd)
+    print('.', end=' ')
+    return etags
+
+
+def _get_content_size(url: str) -> int:
+    """
+    Returns the size of the content as it will be written when
+    downloaded, or 0 if it is not known
+    """
+
+    response = _SESSION.head(url, allow_redirects=True)
+    if not response.ok:
+        return 0
+    if response.headers.get('Content-Encoding'):
+        return 0
+    return int(response.headers.get('Content-Length', 0))
+
+
+def _write_content(response: Response, to: IO):
+    buffered = None
+    if isinstance(to, io.RawIOBase):
+        # Batch writes to unbuffered destinations
+        buffered = io.BufferedWriter(to, buffer_size=DOWNLOAD_BUFFER_SIZE)
+    with response:
+        response.raw.decode_content = True
+        shutil.copyfileobj(response.raw, _ProgressWriter(buffered or to),
+                           length=DOWNLOAD_CHUNK_SIZE)
+    if buffered is not None:
+        buffered.flush()
+        # Keep the destination open for the caller
+        buffered.detach()
+
+
+class _ProgressWriter:
+    """
+    Passes writes through to the destination, printing a progress
+    mark for every PROGRESS_STEP bytes written
+    """
+
+    def __init__(self, to: IO):
+        self.to = to
+        self.written = 0
+        self.next_mark = PROGRESS_STEP
+
+    def write(self, b) -> int:
+        n = self.to.write(b)
+        self.written += len(b)
+        while self.written >= self.next_mark:
+            print('#', end='')
+            self.next_mark += PROGRESS_STEP
+        return n
+
+
+def _get_range_download_size(url: str, to: IO) -> int:
+    """
+    Returns the size of the content if it can be downloaded with
+    parallel range requests, otherwise 0
+    """
+
+    try:
+        if not to.seekable():
+            return 0
+    except (AttributeError, ValueError):
+        return 0
+    if 'a' in getattr(to, 'mode', ''):
+        # Writes to a file opened for appending ignore the offset
+        return 0
+    size = _get_range_size(url)
+    if size < MIN_RANGE_DOWNLOAD_SIZE:
+        return 0
+    return size
+
+
+def _get_range_size(url: str, params = None) -> int:
+    """
+    Returns the size of the content if the server accepts byte range
+    requests for the URL, otherwise 0
+    """
+
+    response = _SESSION.head(url, allow_redirects=True, params=params)
+    if not response.ok:
+        return 0
+    headers = response.headers
+    if headers.get('Accept-Ranges', '').lower() != 'bytes':
+        return 0
+    if headers.get('Content-Encoding'):
+        return 0
+    return int(headers.get('Content-Length', 0))
+
+
+def _part_size(size: int, parts: int = RANGE_DOWNLOAD_PARTS) -> int:
+    return -(-size // max(1, parts))
+
+
+def _range_header(start: int, end: int) -> dict:
+    return {'Range': 'bytes={:d}-{:d}'.format(start, end - 1)}
+
+
+_CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+def _check_content_range(response: Response, start: int, end: int,
+                         size: int):
+    """
+    Raises an exception unless a partial response covers exactly
+    the requested range of the content of the expected size
+    """
+
+    value = response.headers.get('Content-Range', '')
+    match = _CONTENT_RANGE.fullmatch(value.strip())
+    if not match:
+        raise Exception("Invalid Content-Range for {}: {}"
+                        .format(response.url, value))
+    first, last, total = match.groups()
+    if int(first) != start or int(last) != end - 1 \
+            or (total != '*' and int(total) != size):
+        raise Exception("Content-Range for {} is {}, expected bytes {:d}-{:d}/{:d}"
+                        .format(response.url, value, start, end - 1, size))
+
+
+def _download_ranges(url: str, to: IO, size: int, first: Response,
+                     parts: int = RANGE_DOWNLOAD_PARTS):
+    """
+    Downloads parts of the content concurrently. The response for the
+    first part has already been received. When the destination is
+    a real file, each part is written at its position with os.pwrite,
+    without any locking
+    """
+
+    base = to.tell()
+    part = _part_size(size, parts)
+    lock = threading.Lock()
+    fd = None
+    if hasattr(os, "pwrite"):
+        try:
+            fd = to.fileno()
+            to.flush()
+        except (AttributeError, OSError, ValueError):
+            fd = None
+
+    def fetch(start: int):
+        end = min(start + part, size)
+        if start == 0:
+            response = first
+        else:
+            response = _SESSION.get(url, stream=True,
+                                    headers=_range_header(start, end))
+            check_http_response(response)
+            if response.status_code != 206:
+                raise Exception("Server ignored Range request for " + url)
+        _check_content_range(response, start, end, size)
+        position = base + start
+        limit = base + end
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            if position + len(chunk) > limit:
+                raise Exception("Part {:d}-{:d} of {} is larger than {:d} bytes"
+                                .format(start, end, url, end - start))
+            if fd is not None:
+                os.pwrite(fd, chunk, position)
+            else:
+                with lock:
+                    to.seek(position)
+                    to.write(chunk)
+            position += len(chunk)
+            print('#', end='')
+        if position != limit:
+            raise Exception("Part {:d}-{:d} of {} is shorter than {:d} bytes"
+                            .format(start, end, url, end - start))
+
+    starts = range(0, size, part)
+    with ThreadPoolExecutor(max_workers=len(starts)) as executor:
+        for _ in executor.map(fetch, starts):
+            pass
+    to.seek(base + size)
+
+
+def parallel_download(url: str, destination: str,
+                      parts: int = RANGE_DOWNLOAD_PARTS):
+    """
+    Downloads content of a URL into a file with several parallel range
+    requests, each writing its part directly at its offset in the file.
+    Falls back to a single request if the server does not support
+    byte ranges
+
+    :param url: URL
+    :param destination: path to the destination file
+    :param parts: number of parts downloaded concurrently
+    :return: ETag of the downloaded content, if the server has sent one
+    """
+
+    size = _get_range_size(url)
+    with open(destination, "wb") as to:
+        if not size or parts < 2:
+            response = _SESSION.get(url, stream=True)
+        else:
+            response = _SESSION.get(
+                url, stream=True,
+                headers=_range_header(0, _part_size(size, parts))
+            )
+            check_http_response(response)
+            if response.status_code == 206:
+                os.ftruncate(to.fileno(), size)
+                _download_ranges(url, to, size, response, parts)
+                print('.', end=' ')
+                return response.headers.get('ETag')
+        check_http_response(response)
+        _write_content(response, to)
+    print('.', end=' ')
+    return response.headers.get('ETag')
 
 
 def is_downloaded(url: str, target: str, check_size: int = 0) -> bool:
@@ -264,23 +1062,229 @@ def is_downloaded(url: str, target: str, check_size: int = 0) -> bool:
     :param target: Destination of teh downloads
     :return: True if the destination file exists and is newer than
         URL content
+
+    If an ETag has been recorded when the destination was downloaded,
+    and the destination still has the size it had then, the check is
+    done with a conditional request: if the content has not changed,
+    the server replies with 304 and sends nothing else. Otherwise,
+    or without a recorded ETag, the headers of the response to a HEAD
+    request are compared with the destination file.
     """
-    if os.path.isfile(target):
-        response = requests.head(url, allow_redirects=True)
+    if not os.path.isfile(target):
+        return False
+    stat = os.stat(target)
+    meta = _REMOTE_META.get(url)
+    if meta is not None:
+        return _is_same_as_local(meta, stat, check_size)
+    etag, size = _load_etag(target, url)
+    if etag and size == stat.st_size:
+        response = _SESSION.get(url, stream=True, allow_redirects=True,
+                                headers={"If-None-Match": etag})
+    else:
+        response = _SESSION.head(url, allow_redirects=True)
+    try:
+        if response.status_code == 304:
+            return check_size <= 0 or stat.st_size > check_size
         check_http_response(response)
-        headers = response.headers
-        remote_size = int(headers.get('content-length', 0))
-        remote_date = parse(headers.get('Last-Modified', 0))
-        stat = os.stat(target)
-        local_size = stat.st_size
-        local_date = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
-        date_check = local_date >= remote_date
-        if check_size == 0:
-            size_check = local_size == remote_size
-        else:
-            size_check = local_size > check_size
-        return date_check and size_check
-    return False
+        meta = _RemoteMeta.from_headers(response.headers)
+        _REMOTE_META.put(url, meta)
+        return _is_same_as_local(meta, stat, check_size)
+    finally:
+        response.close()
+
+
+def _last_modified_validator(url: str, target: str):
+    """
+    Returns Last-Modified date of the URL content to be sent as If-Range
+    to continue a partial download into the target, if the partial
+    content has been written after the remote content has been
+    modified. Otherwise, returns None, as the partial content might
+    come from its previous version
+    """
+
+    meta = _REMOTE_META.get(url)
+    if meta is None:
+        response = _SESSION.head(url, allow_redirects=True)
+        if not response.ok:
+            return None
+        meta = _RemoteMeta.from_headers(response.headers)
+        _REMOTE_META.put(url, meta)
+    if meta.last_modified.timestamp() <= 0:
+        # Unknown
+        return None
+    local_date = datetime.fromtimestamp(os.stat(target).st_mtime,
+                                        timezone.utc)
+    if local_date < meta.last_modified:
+        return None
+    return format_datetime(meta.last_modified.astimezone(timezone.utc),
+                           usegmt=True)
+
+
+class _RemoteMeta:
+    __slots__ = ("etag", "last_modified", "content_length")
+
+    def __init__(self, etag, last_modified: datetime, content_length: int):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_length = content_length
+
+    @classmethod
+    def from_headers(cls, headers) -> "_RemoteMeta":
+        return cls(
+            headers.get('ETag'),
+            _parse_http_date(headers.get('Last-Modified')),
+            int(headers.get('content-length', 0))
+        )
+
+
+class _RemoteMetaCache:
+    """
+    A small thread-safe LRU cache of remote content metadata with
+    a time to live, so that repeated freshness checks of the same URL
+    do not go to the server every time
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, url: str):
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return None
+            expires, meta = entry
+            if expires < time.monotonic():
+                del self.entries[url]
+                return None
+            self.entries.move_to_end(url)
+            return meta
+
+    def put(self, url: str, meta: _RemoteMeta):
+        with self.lock:
+            self.entries[url] = (time.monotonic() + self.ttl, meta)
+            self.entries.move_to_end(url)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_REMOTE_META = _RemoteMetaCache(maxsize=1024, ttl=REMOTE_META_TTL)
+
+
+def clear_remote_cache():
+    """
+    Forgets metadata of remote content remembered by is_downloaded
+    """
+
+    _REMOTE_META.clear()
+
+
+def _is_same_as_local(meta: _RemoteMeta, stat: os.stat_result,
+                      check_size: int) -> bool:
+    remote_size = meta.content_length
+    remote_date = meta.last_modified
+    local_size = stat.st_size
+    local_date = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+    date_check = local_date >= remote_date
+    if check_size == 0:
+        size_check = local_size == remote_size
+    else:
+        size_check = local_size > check_size
+    return date_check and size_check
+
+
+def _parse_http_date(value: str) -> datetime:
+    """
+    Parses date in HTTP header, which normally has the fixed RFC 7231
+    format, falling back to the generic parser for anything else
+    """
+
+    if not value:
+        return datetime.fromtimestamp(0, timezone.utc)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        date = parse(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date
+
+
+def _etags_path(target: str) -> str:
+    # Hidden, so that directory listings do not pick it up as data
+    directory, name = os.path.split(target)
+    return os.path.join(directory, "." + name + ".etag")
+
+
+def _load_records(target: str) -> dict:
+    try:
+        with open(_etags_path(target)) as f:
+            records = json.load(f)
+    except (OSError, ValueError):
+        return dict()
+    if not isinstance(records, dict):
+        return dict()
+    return records
+
+
+def _load_etag(target: str, url: str) -> Tuple:
+    """
+    Returns ETag of the URL and the size of the target when it has been
+    recorded, or Nones, if nothing has been recorded
+    """
+
+    record = _load_records(target).get(url)
+    if isinstance(record, dict):
+        return record.get("etag"), record.get("size")
+    return None, None
+
+
+def load_etags(target: str) -> dict:
+    """
+    Returns ETags of the URLs downloaded into the target, as recorded
+    in a sidecar file next to the target
+
+    :param target: path to the downloaded file
+    :return: a dictionary mapping URLs to their ETags
+    """
+
+    return {
+        url: record["etag"]
+        for url, record in _load_records(target).items()
+        if isinstance(record, dict) and record.get("etag")
+    }
+
+
+def save_etags(target: str, etags: dict):
+    """
+    Records ETags of the URLs downloaded into the target in a sidecar
+    file next to the target, together with the current size of the
+    target. If there are no ETags, removes the sidecar
+
+    :param target: path to the downloaded file
+    :param etags: a dictionary mapping URLs to their ETags
+    """
+
+    path = _etags_path(target)
+    etags = {url: etag for url, etag in (etags or dict()).items() if etag}
+    if etags:
+        size = os.stat(target).st_size
+        with open(path, "w") as f:
+            json.dump({
+                url: {"etag": etag, "size": size}
+                for url, etag in etags.items()
+            }, f)
+    elif os.path.isfile(path):
+        os.remove(path)
+
+
+_PROGRESS_ROWS = 10000
 
 
 def write_csv(reader: csv.DictReader,
@@ -292,6 +1296,12 @@ def write_csv(reader: csv.DictReader,
     Rewrites the CSV content optionally transforming and
     filtering rows
 
+    When the reader and the writer have the same field names, rows are
+    copied without building dictionaries, and transformer and filter
+    receive a mutable mapping over the row values instead of a dict.
+    It supports the usual mapping operations, and ``row.copy()`` or
+    ``dict(row)`` returns an independent dict
+
     :param transformer: An optional callable that tranmsforms a row in place
     :param reader: Input data as an instance of csv.DictReader
     :param writer: Output source should be provided as csv.DictWriter
@@ -301,14 +1311,290 @@ def write_csv(reader: csv.DictReader,
     :param write_header: whether to first write header row
     :return: Nothing
     """
-    counter = 0
     if write_header:
         writer.writeheader()
-    for row in reader:
+    if _is_positional_copy(reader, writer):
+        if not transformer and not filter:
+            _copy_rows(reader, writer)
+        else:
+            _transform_rows(reader, writer, transformer, filter)
+        return
+    # Rows are processed in blocks, one specialized loop per combination
+    # of transformer and filter, so that nothing is checked or counted
+    # for every row
+    writerows = _schema_writer(writer)
+    rows = iter(reader)
+    while True:
+        block = list(itertools.islice(rows, _PROGRESS_ROWS))
+        if not block:
+            break
+        if transformer and filter:
+            selected = []
+            for row in block:
+                transformer(row)
+                if filter(row):
+                    selected.append(row)
+            writerows(selected)
+        elif transformer:
+            for row in block:
+                transformer(row)
+            writerows(block)
+        elif filter:
+            writerows([row for row in block if filter(row)])
+        else:
+            writerows(block)
+        if len(block) < _PROGRESS_ROWS:
+            break
+        print("*", end="")
+    print()
+
+
+def _schema_writer(writer) -> Callable:
+    """
+    Returns a function writing a list of row mappings. For csv.DictWriter,
+    values are extracted with an itemgetter built once from the field
+    names and passed directly to the underlying csv writer. Rows that
+    do not have exactly these keys go through DictWriter, so that
+    missing and extra keys are handled as it does
+    """
+
+    if not isinstance(writer, csv.DictWriter):
+        return writer.writerows
+    fields = list(writer.fieldnames)
+    width = len(fields)
+    if width == 1:
+        field = fields[0]
+        getter = lambda row: (row[field],)
+    else:
+        getter = operator.itemgetter(*fields)
+    out = writer.writer
+
+    def writerows(rows):
+        values = []
+        for row in rows:
+            if len(row) == width:
+                try:
+                    values.append(getter(row))
+                    continue
+                except KeyError:
+                    pass
+            out.writerows(values)
+            values = []
+            writer.writerow(row)
+        out.writerows(values)
+
+    return writerows
+
+
+def write_csv_arrow(src: str, dest: str, filter_expr=None,
+                    transformer: Callable = None,
+                    block_size: int = 8 * DOWNLOAD_CHUNK_SIZE):
+    """
+    Rewrites CSV file optionally transforming and filtering rows, a block
+    of rows at a time, using pyarrow. Unlike write_csv, rows are never
+    converted to Python objects, so the transformation and the filter
+    have to work on Arrow data
+
+    :param src: path to the input CSV file, can be compressed
+    :param dest: path to the output CSV file, can be gzipped
+    :param filter_expr: Optionally, a pyarrow.compute.Expression
+        selecting rows that should be written to the output
+    :param transformer: Optionally, a callable taking pyarrow.Table
+        with a block of rows and returning transformed pyarrow.Table
+    :param block_size: size of the blocks of the input, in bytes
+    :return: Number of rows written
+    """
+
+    try:
+        import pyarrow
+        import pyarrow.csv as pyarrow_csv
+    except ImportError:
+        raise Exception("pyarrow is required to rewrite CSV with Arrow")
+    read_options = pyarrow_csv.ReadOptions(block_size=block_size)
+    reader = pyarrow_csv.open_csv(src, read_options=read_options)
+    counter = 0
+    writer = None
+    with fopen(dest, "wb") as output:
+        try:
+            for batch in reader:
+                table = pyarrow.Table.from_batches([batch])
+                if transformer:
+                    table = transformer(table)
+                if filter_expr is not None:
+                    table = table.filter(filter_expr)
+                if writer is None:
+                    writer = pyarrow_csv.CSVWriter(output, table.schema)
+                writer.write_table(table)
+                counter += table.num_rows
+                print("*", end="")
+            if writer is None:
+                # Empty input, only the header is written
+                writer = pyarrow_csv.CSVWriter(output, reader.schema)
+        finally:
+            if writer is not None:
+                writer.close()
+    print()
+    return counter
+
+
+def _is_positional_copy(reader, writer) -> bool:
+    """
+    Checks if rows can be copied from reader to writer as lists of
+    values, without building a mapping for every row
+    """
+
+    if not isinstance(reader, csv.DictReader):
+        return False
+    if not isinstance(writer, csv.DictWriter):
+        return False
+    fieldnames = reader.fieldnames
+    return fieldnames is not None and list(fieldnames) == list(writer.fieldnames)
+
+
+def _copy_rows(reader: csv.DictReader, writer: csv.DictWriter):
+    """
+    Copies rows between underlying csv reader and writer in bulk.
+    Rows that do not match the header are passed through
+    DictWriter the same way as DictReader would have returned them
+    """
+
+    fieldnames = reader.fieldnames
+    width = len(fieldnames)
+    counter = 0
+    rows = []
+    for row in reader.reader:
+        if len(row) == width:
+            rows.append(row)
+        elif row:
+            writer.writer.writerows(rows)
+            rows = []
+            writer.writerow(_as_mapping(reader, row))
+        else:
+            # DictReader skips empty rows
+            continue
+        counter += 1
+        if (counter % 10000) == 0:
+            writer.writer.writerows(rows)
+            rows = []
+            print("*", end="")
+    writer.writer.writerows(rows)
+    print()
+
+
+def _as_mapping(reader: csv.DictReader, row: List) -> dict:
+    """
+    Builds the mapping DictReader would return for a row that does
+    not match the header
+    """
+
+    fieldnames = reader.fieldnames
+    width = len(fieldnames)
+    mapping = dict(zip(fieldnames, row))
+    if len(row) > width:
+        mapping[reader.restkey] = row[width:]
+    else:
+        for key in fieldnames[len(row):]:
+            mapping[key] = reader.restval
+    return mapping
+
+
+_DELETED = object()
+
+
+class _RowView(MutableMapping):
+    """
+    A mapping from column names to values of a row stored as a list.
+    Lets transformers and filters written for DictReader rows
+    work on positional rows
+    """
+
+    __slots__ = ("index", "values", "extra")
+
+    def __init__(self, index: dict, values: List):
+        self.index = index
+        self.values = values
+        self.extra = None
+
+    def __getitem__(self, key):
+        i = self.index.get(key)
+        if i is None:
+            if self.extra is None:
+                raise KeyError(key)
+            return self.extra[key]
+        value = self.values[i]
+        if value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        i = self.index.get(key)
+        if i is None:
+            if self.extra is None:
+                self.extra = dict()
+            self.extra[key] = value
+        else:
+            self.values[i] = value
+
+    def __delitem__(self, key):
+        i = self.index.get(key)
+        if i is None or self.values[i] is _DELETED:
+            if self.extra is None:
+                raise KeyError(key)
+            del self.extra[key]
+            return
+        self.values[i] = _DELETED
+        if self.extra is None:
+            self.extra = dict()
+
+    def __iter__(self):
+        for key, i in self.index.items():
+            if self.values[i] is not _DELETED:
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def copy(self) -> dict:
+        return dict(self)
+
+    def is_positional(self) -> bool:
+        """
+        Checks if the row still has exactly the columns of the header
+        """
+        return self.extra is None
+
+
+def _transform_rows(reader: csv.DictReader, writer: csv.DictWriter,
+                    transformer, filter):
+    """
+    Transforms, filters and writes rows without building a dictionary
+    for every row. Transformer and filter receive a mapping view
+    of the positional row. Rows with columns added or removed
+    are written through DictWriter
+    """
+
+    fieldnames = reader.fieldnames
+    width = len(fieldnames)
+    index = {key: i for i, key in enumerate(fieldnames)}
+    writerow = writer.writer.writerow
+    counter = 0
+    for values in reader.reader:
+        if len(values) == width:
+            row = _RowView(index, values)
+        elif values:
+            row = _as_mapping(reader, values)
+        else:
+            # DictReader skips empty rows
+            continue
         if transformer:
             transformer(row)
         if (not filter) or filter(row):
-            writer.writerow(row)
+            if type(row) is _RowView and row.is_positional():
+                writerow(values)
+            else:
+                writer.writerow(dict(row))
         counter += 1
         if (counter % 10000) == 0:
             print("*", end="")
@@ -316,8 +1602,31 @@ def write_csv(reader: csv.DictReader,
 
 
 def count_lines(f):
-    with fopen(f, "r") as x:
-        return sum(1 for line in x)
+    """
+    Counts lines in a file, possibly gzipped. The file is read
+    in large binary blocks and newlines are counted in every block,
+    without splitting content into lines
+
+    :param f: path to file or a binary stream
+    :return: number of lines, the last line does not have to end
+        with a newline
+    """
+
+    if not isinstance(f, str):
+        with fopen(f, "r") as x:
+            return sum(1 for line in x)
+    n = 0
+    last = b"\n"
+    with fopen(f, "rb") as x:
+        while True:
+            block = x.read(DOWNLOAD_CHUNK_SIZE)
+            if not block:
+                break
+            n += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        n += 1
+    return n
 
 
 class Collector(ABC):
@@ -364,9 +1673,12 @@ def as_dict(json_or_yaml_file: str) -> dict:
         with open(json_or_yaml_file) as f:
             ff = json_or_yaml_file.lower()
             if ff.endswith(".json"):
-                content = json.load(f)
+                if orjson is not None:
+                    content = orjson.loads(f.read())
+                else:
+                    content = json.load(f)
             elif ff.endswith(".yml") or ff.endswith(".yaml"):
-                content = yaml.safe_load(f)
+                content = yaml.load(f, Loader=SafeLoader)
             else:
                 raise Exception("Unsupported format for user request: {}"
                                 .format(json_or_yaml_file) +
@@ -379,31 +1691,75 @@ def as_dict(json_or_yaml_file: str) -> dict:
     return content
 
 
-def dataframe2csv(df: DataFrame, dest: str, append: bool):
-    t0 = datetime.datetime.now()
+def dataframe2csv(df: DataFrame, dest: str, append: bool,
+                  columnar: bool = False):
+    """
+    Writes R data frame to a CSV file
+
+    :param df: R data frame
+    :param dest: path to the destination file, can be gzipped
+    :param append: whether to append to the existing file, if True,
+        header row is not written
+    :param columnar: If True and pyarrow is installed, converts the whole
+        data frame to Arrow table and writes it with pyarrow, without
+        converting values to Python objects. Missing values are then
+        written as empty fields rather than NA
+    :return: Nothing
+    """
+
+    if columnar and _dataframe2csv_arrow(df, dest, append):
+        return
+    t0 = datetime.now()
     columns = {
         df.colnames[c]: vector2list(df[c]) for c in range(df.ncol)
     }
-    t1 = datetime.datetime.now()
+    t1 = datetime.now()
 
     if append:
         mode = "at"
     else:
         mode = "wt"
     with fopen(dest, mode) as output:
-        writer = csv.DictWriter(output, columns, quoting=csv.QUOTE_NONNUMERIC)
+        writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC)
         if not append:
-            writer.writeheader()
-        for r in range(df.nrow):
-            row = {
-                column: columns[column][r] for column in columns
-            }
-            writer.writerow(row)
-    t2 = datetime.datetime.now()
+            writer.writerow(list(columns))
+        writer.writerows(zip(*columns.values()))
+    t2 = datetime.now()
     print("{} + {} = {}".format(str(t1-t0), str(t2-t1), str(t2-t0)))
     return
 
 
+def _dataframe2csv_arrow(df: DataFrame, dest: str, append: bool) -> bool:
+    """
+    Writes R data frame to a CSV file with pyarrow. Returns False,
+    without writing anything, if pyarrow or pandas are not installed
+    """
+
+    try:
+        import pyarrow
+        import pyarrow.csv as pyarrow_csv
+        import rpy2.robjects as robjects
+        from rpy2.robjects import pandas2ri
+    except ImportError:
+        return False
+    t0 = datetime.now()
+    with (robjects.default_converter + pandas2ri.converter).context():
+        pdf = robjects.conversion.get_conversion().rpy2py(df)
+    table = pyarrow.Table.from_pandas(pdf, preserve_index=False)
+    t1 = datetime.now()
+
+    if append:
+        mode = "ab"
+    else:
+        mode = "wb"
+    options = pyarrow_csv.WriteOptions(include_header=not append)
+    with fopen(dest, mode) as output:
+        pyarrow_csv.write_csv(table, output, write_options=options)
+    t2 = datetime.now()
+    print("{} + {} = {}".format(str(t1-t0), str(t2-t1), str(t2-t0)))
+    return True
+
+
 def fst2csv(path: str, buffer_size = 10000):
     if not path.endswith(".fst"):
         raise Exception("Unknown format of file " + path)
@@ -411,18 +1767,20 @@ def fst2csv(path: str, buffer_size = 10000):
     dest = name + ".csv.gz"
     n = 0
     t0 = datetime.now()
-    with FSTReader(path, returns_mapping=True) as reader, fopen(dest, "wt") as output:
-        writer = csv.DictWriter(output, reader.columns, quoting=csv.QUOTE_NONNUMERIC)
-        writer.writeheader()
+    with FSTReader(path, buffer_size) as reader, \
+            _gzip_open(dest, "wt", parallel=True) as output:
+        writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC)
+        writer.writerow(list(reader.columns))
         width = len(reader.columns)
-        for row in reader:
-            writer.writerow(row)
-            n += 1
-            if (n % buffer_size) == 0:
-                t2 = datetime.now()
-                rate = n / (t2 - t0).seconds
-                logging.info("Read {}: {:d} x {:d}; {} {:f} rows/sec".format(path, n, width, str(t2-t0), rate))
-    logger.info("Complete. Total read {}: {:d} x {:d}".format(path, width, n))
+        # Each block is written by the csv module at once,
+        # without building a row mapping for every record
+        for block in reader.blocks():
+            writer.writerows(zip(*block.values()))
+            n = reader.pointer - 1
+            t2 = datetime.now()
+            rate = n / max((t2 - t0).total_seconds(), 1e-6)
+            logging.info("Read {}: {:d} x {:d}; {} {:f} rows/sec".format(path, n, width, str(t2-t0), rate))
+    logger.info("Complete. Total read {}: {:d} x {:d}".format(path, n, width))
     return
 
 
@@ -449,7 +1807,7 @@ class SpecialValues:
         return cls.is_missing(v) or v in ['0']
 
 
-class CSVFileWrapper():
+class CSVFileWrapper(io.TextIOBase):
     """
     A wrapper around CSV reader that does:
 
@@ -457,6 +1815,17 @@ class CSVFileWrapper():
     * Logging of the progress of the file being read
     * Performs on-the-fly replacement of null and special
       values
+
+    ``read`` and ``readline`` are defined on the class, so that
+    they are resolved without going through ``__getattr__``. So are
+    the io.TextIOBase members, which forward to the wrapped stream
+    rather than fall back to their io.IOBase defaults. Seeking drops
+    the text that has been read ahead but not returned yet. The wrapped
+    stream is closed by ``close()`` or by leaving the ``with`` block,
+    but never when the wrapper is garbage collected.
+
+    If the wrapped stream is binary, the replacement is done on bytes,
+    without decoding, and bytes are returned
     """
 
     def __init__(self, file_like_object, sep = ',', null_replacement = SpecialValues.NA):
@@ -467,76 +1836,155 @@ class CSVFileWrapper():
         self.null_string = self.sep + self.null_replacement + sep
         self.empty_string_eol = self.sep + '\n'
         self.null_string_eol = self.sep + self.null_replacement + '\n'
+        # A separator followed by another separator or end of line
+        # marks an empty value
+        empty_re = re.compile(
+            re.escape(sep) + '(?=' + re.escape(sep) + '|\n)'
+        )
+        null_value = (self.sep + self.null_replacement).replace('\\', r'\\')
+        # Separator, pattern, replacement and newline for text
+        # and binary streams
+        self._syntax = {
+            str: (sep, empty_re, null_value, '\n'),
+            bytes: (
+                sep.encode("utf-8"),
+                re.compile(empty_re.pattern.encode("utf-8")),
+                null_value.encode("utf-8"),
+                b'\n'
+            )
+        }
         self.l = len(sep)
-        self.remainder = ""
+        # Processed text not yet returned is buffer[offset:]
+        self._buffer = ""
+        self._offset = 0
         self.line_number = 0
         self.last_printed_line_number = 0
         self.chars = 0
+        self._last_t = time.monotonic()
 
-    def __getattr__(self, called_method):
-        if called_method == "readline":
-            return self._readline
-        if called_method == "read":
-            return self._read
-        return getattr(self.file_like_object, called_method)
+    def __getattr__(self, name):
+        # Only called for attributes not defined by the wrapper itself
+        if name == "file_like_object":
+            raise AttributeError(name)
+        return getattr(self.file_like_object, name)
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.file_like_object.close()
+        self.close()
+
+    def __del__(self):
+        # The wrapped stream belongs to the caller, io.IOBase would
+        # close it on garbage collection
+        pass
 
-    def _replace_empty(self, s: str):
-        while self.empty_string in s:
-            s = s.replace(self.empty_string, self.null_string)
-        s = s.replace(self.empty_string_eol, self.null_string_eol)
-        return s
+    def readable(self) -> bool:
+        return True
+
+    @property
+    def encoding(self):
+        return getattr(self.file_like_object, "encoding", None)
+
+    @property
+    def errors(self):
+        return getattr(self.file_like_object, "errors", None)
+
+    @property
+    def newlines(self):
+        return getattr(self.file_like_object, "newlines", None)
+
+    def fileno(self) -> int:
+        return self.file_like_object.fileno()
+
+    def isatty(self) -> bool:
+        return self.file_like_object.isatty()
 
-    def _readline(self):
+    def seekable(self) -> bool:
+        return self.file_like_object.seekable()
+
+    def seek(self, offset, whence = io.SEEK_SET):
+        self._buffer = self._buffer[:0]
+        self._offset = 0
+        return self.file_like_object.seek(offset, whence)
+
+    def tell(self):
+        return self.file_like_object.tell()
+
+    def close(self):
+        if not self.closed:
+            self.file_like_object.close()
+        super().close()
+
+    def _replace_empty(self, s):
+        _, pattern, null_value, _ = self._syntax[type(s)]
+        return pattern.sub(null_value, s)
+
+    def readline(self, size = -1):
         line = self.file_like_object.readline()
         self.line_number += 1
         self.chars += len(line)
         return self._replace_empty(line)
 
-    def _read(self, size, *args, **keyargs):
-        if (len(self.remainder) < size):
-            raw_buffer = self.file_like_object.read(size, *args, **keyargs)
-            buffer = raw_buffer
-            while buffer[-self.l:] == self.sep:
-                next_char = self.file_like_object.read(self.l)
-                buffer += next_char
+    @property
+    def remainder(self) -> str:
+        return self._buffer[self._offset:]
+
+    def read(self, size = -1, *args, **keyargs):
+        available = len(self._buffer) - self._offset
+        if size is None or size < 0:
+            result = self._replace_empty(self.file_like_object.read())
+            if available:
+                result = self.remainder + result
+            self._buffer = result[:0]
+            self._offset = 0
+            self.chars += len(result)
+            self.line_number += result.count(self._syntax[type(result)][3])
+            return result
+        if available < size:
+            buffer = self.file_like_object.read(size, *args, **keyargs)
+            if buffer.endswith(self._syntax[type(buffer)][0]):
+                # Complete the line, so that empty values are not split
+                # between two buffers
+                buffer += self.file_like_object.readline()
             buffer = self._replace_empty(buffer)
+            if available:
+                # Only the short unread tail is copied
+                buffer = self._buffer[self._offset:] + buffer
+            self._buffer = buffer
+            self._offset = 0
+
+        # Serve from the buffer by moving the offset rather than
+        # copying what is left into a new string on every call
+        start = self._offset
+        end = start + size
+        if start == 0 and end >= len(self._buffer):
+            result = self._buffer
         else:
-            raw_buffer = ""
-            buffer = raw_buffer
-        if self.remainder:
-            buffer = self.remainder + buffer
-            self.remainder = ""
-
-        if len(buffer) > size:
-            self.remainder = buffer[size - len(buffer):]
-            result = buffer[0:size]
-        else:
-            result = buffer
+            result = self._buffer[start:end]
+        self._offset = min(end, len(self._buffer))
 
         self.chars += len(result)
-        nl = result.count('\n')
+        nl = result.count(self._syntax[type(result)][3])
         self.line_number += nl
-        t = datetime.datetime.now()
         if (self.line_number - self.last_printed_line_number) > 1000000:
-            if self.chars > 1000000000:
-                c = "{:7.2f}G".format(self.chars/1000000000.0)
-            elif self.chars > 1000000:
-                c = "{:6.2f}M".format(self.chars/1000000.0)
-            else:
-                c = str(self.chars)
-            dt = datetime.datetime.now() - t
-            t = datetime.datetime.now()
-            logging.info("{}: Processed {:,}/{} lines/chars [{}]"
-                  .format(str(t), self.line_number, c, str(dt)))
-            self.last_printed_line_number = self.line_number
+            self._log_progress()
         return result
 
+    def _log_progress(self):
+        now = time.monotonic()
+        dt = timedelta(seconds=now - self._last_t)
+        self._last_t = now
+        if self.chars > 1000000000:
+            c = "{:7.2f}G".format(self.chars/1000000000.0)
+        elif self.chars > 1000000:
+            c = "{:6.2f}M".format(self.chars/1000000.0)
+        else:
+            c = str(self.chars)
+        logging.info("{}: Processed {:,}/{} lines/chars [{}]"
+              .format(str(datetime.now()), self.line_number, c, str(dt)))
+        self.last_printed_line_number = self.line_number
+
 
 def basename(path):
     """
@@ -566,15 +2014,10 @@ def is_readme(name: str) -> bool:
     """
 
     name = name.lower()
-    if name.endswith(".md"):
-        return True
-    if name.startswith("readme"):
-        return True
-    if name.startswith("read.me"):
-        return True
-    if "readme" in name:
-        return True
-    return False
+    # "readme" in name also covers names starting with "readme"
+    return (name.endswith(".md")
+            or "readme" in name
+            or name.startswith("read.me"))
 
 
 def get_entries(path: str) -> Tuple[List,Callable]:
@@ -587,25 +2030,17 @@ def get_entries(path: str) -> Tuple[List,Callable]:
     to open these entries for reading
     """
 
-    if path.endswith(".tar") or path.endswith(".tgz") or path.endswith(
-            ".tar.gz"):
-        tfile = tarfile.open(path)
-        entries = [
-            e for e in tfile.getmembers()
-                if e.isfile() and not is_readme(e.name)
-        ]
-        f = lambda e: codecs.getreader("utf-8")(tfile.extractfile(e))
-    elif path.endswith(".zip"):
-        zfile = zipfile.ZipFile(path)
-        entries = [
-            e for e in zfile.namelist() if not is_readme(e)
-        ]
-        f = lambda e: io.TextIOWrapper(zfile.open(e))
+    if path.endswith((".tar", ".tgz", ".tar.gz", ".zip")):
+        stat = os.stat(path)
+        entries = list(_list_archive(path, stat.st_mtime_ns, stat.st_size))
+        if path.endswith(".zip"):
+            zfile = zipfile.ZipFile(path)
+            f = lambda e: io.TextIOWrapper(zfile.open(e))
+        else:
+            tfile = tarfile.open(path)
+            f = lambda e: codecs.getreader("utf-8")(tfile.extractfile(e))
     elif os.path.isdir(path):
-        entries = [
-            filename for filename in glob.iglob(path + '**/**', recursive=True)
-            if os.path.isfile(filename) and not is_readme(filename)
-        ]
+        entries = list(_walk_files(path))
         f = lambda e: fopen(e, "rt")
     elif os.path.isfile(path):
         entries = [path]
@@ -616,6 +2051,47 @@ def get_entries(path: str) -> Tuple[List,Callable]:
     return entries, f
 
 
+def _walk_files(path: str):
+    """
+    Recursively yields paths of files in a directory, except
+    documentation and hidden files
+
+    The entries returned by os.scandir carry file type, so that
+    no additional stat call is needed for most of them
+    """
+
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_file():
+                if not is_readme(entry.name):
+                    yield entry.path
+            elif entry.is_dir():
+                yield from _walk_files(entry.path)
+
+
+@functools.lru_cache(maxsize=128)
+def _list_archive(path: str, mtime: int, size: int) -> Tuple:
+    """
+    Lists entries of an archive: names of zip entries or tar members.
+    The listing is cached, modification time and size of the archive
+    are part of the key, so that a modified archive is listed again.
+    Only the listing is cached, the archive itself is not kept open
+    """
+
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as zfile:
+            return tuple(
+                e for e in zfile.namelist() if not is_readme(e)
+            )
+    with tarfile.open(path) as tfile:
+        return tuple(
+            e for e in tfile.getmembers()
+                if e.isfile() and not is_readme(e.name)
+        )
+
+
 def get_readme(path:str):
     """
     Looks for a README file in the specified path
@@ -18,7 +18,8 @@
 #
 
 import datetime
-from typing import Optional
+import functools
+from typing import Dict, Iterator, List, Optional
 
 import rpy2.robjects as robjects
 import rpy2.robjects.packages as rpackages
@@ -26,6 +27,10 @@ from rpy2.rinterface import NULL
 from rpy2.robjects import DataFrame
 from rpy2.robjects.vectors import DateVector
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 EPOCH = datetime.date(year=1970, month=1, day=1).toordinal()
 
@@ -37,6 +42,7 @@ def choose_cran_mirror():
     return utils
 
 
+@functools.lru_cache(maxsize=1)
 def ensure_packages():
     utils = choose_cran_mirror()
     packages = ["fst"]
@@ -47,9 +53,14 @@ def ensure_packages():
     return
 
 
-def read_fst(path: str, start=1, end=None) -> (DataFrame, bool):
+@functools.lru_cache(maxsize=1)
+def _r_read_fst():
     ensure_packages()
-    f = robjects.r["read_fst"]
+    return robjects.r["read_fst"]
+
+
+def read_fst(path: str, start=1, end=None) -> (DataFrame, bool):
+    f = _r_read_fst()
     if start != 1 or end is not None:
         df = f(path, NULL, start, end)
         if end is None:
@@ -65,13 +76,59 @@ def read_fst(path: str, start=1, end=None) -> (DataFrame, bool):
 
 
 def vector2list(v):
+    if DateVector.isrinstance(v) and np is None:
+        return [
+            datetime.date.fromordinal(EPOCH + int(d)) if d == d else None
+            for d in v
+        ]
     if DateVector.isrinstance(v):
-        return [datetime.date.fromordinal(EPOCH + int(d)) if d == d else None for d in v]
+        # Missing values and day arithmetic are handled by numpy,
+        # only actual dates are converted one by one
+        days = np.asarray(v, dtype=np.float64)
+        present = np.flatnonzero(~np.isnan(days))
+        ordinals = (days[present].astype(np.int64) + EPOCH).tolist()
+        dates = [None] * days.size
+        fromordinal = datetime.date.fromordinal
+        for i, o in zip(present.tolist(), ordinals):
+            dates[i] = fromordinal(o)
+        return dates
+    if isinstance(v, list):
+        return v
     return list(v)
 
 
+def read_fst_columns(path: str, start=1, end=None) -> (Dict[str, List], int, bool):
+    """
+    Reads rows of FST file with R as columns of Python values
+
+    :param path: path to FST file
+    :param start: first row to read, starting from 1
+    :param end: last row to read, inclusive, or None to read till the end
+    :return: a tuple of a mapping from column names to lists of values,
+        the number of rows read and a flag whether the end of file
+        has been reached
+    """
+
+    df, complete = read_fst(path, start, end)
+    columns = {
+        df.colnames[c]: vector2list(df[c]) for c in range(df.ncol)
+    }
+    return columns, df.nrow, complete
+
+
 class FSTReader:
-    def __init__(self, path, buffer_size = 10000, returns_mapping = False):
+    def __init__(self, path, buffer_size = 10000, returns_mapping = False,
+                 reuse_buffer = False):
+        """
+        :param path: path to FST file
+        :param buffer_size: number of rows read from the file at once
+        :param returns_mapping: if True, iterating returns rows as
+            dictionaries, otherwise as lists
+        :param reuse_buffer: if True and rows are returned as lists,
+            the same list is filled and returned for every row. It is
+            only valid until the next row is requested and has to be
+            copied if kept
+        """
         if not path.endswith(".fst"):
             raise Exception("Unknown format of file " + path)
         self.path = path
@@ -82,15 +139,22 @@ class FSTReader:
         self.first = 0
         self.complete = False
         self.returns_mapping = returns_mapping
+        self.reuse_buffer = reuse_buffer
+        self._names = ()
+        self._values = ()
+        self._row = []
 
     def read_next(self):
         self.first = self.pointer
         end = self.first + self.buffer_size - 1
-        df, self.complete = read_fst(self.path, self.first, end)
-        self.last = self.pointer + df.nrow
-        self.columns = {
-            df.colnames[c]: vector2list(df[c]) for c in range(df.ncol)
-        }
+        self.columns, nrow, self.complete = read_fst_columns(
+            self.path, self.first, end
+        )
+        self.last = self.pointer + nrow
+        self._names = tuple(self.columns)
+        self._values = tuple(self.columns.values())
+        if len(self._row) != len(self._names):
+            self._row = [None] * len(self._names)
 
     def current(self) -> Optional[int]:
         if self.pointer >= self.last:
@@ -101,23 +165,47 @@ class FSTReader:
                 return None
         return self.pointer - self.first
 
+    def blocks(self) -> Iterator[Dict[str, List]]:
+        """
+        Iterates over the remaining rows a block at a time, as they
+        are read from the file
+
+        :return: iterator over mappings of column names to lists
+            of column values in the block
+        """
+
+        while True:
+            r = self.current()
+            if r is None:
+                return
+            if r == 0:
+                block = self.columns
+            else:
+                block = {
+                    column: values[r:] for column, values in self.columns.items()
+                }
+            self.pointer = self.last
+            yield block
+
     def current_row(self) -> Optional[list]:
         r = self.current()
         if r is None:
             return None
-        row = [
-            self.columns[column][r] for column in self.columns
-        ]
-        return row
+        if self.reuse_buffer:
+            row = self._row
+            for i, values in enumerate(self._values):
+                row[i] = values[r]
+            return row
+        return [values[r] for values in self._values]
 
     def current_mapping(self) -> Optional[dict]:
         r = self.current()
         if r is None:
             return None
-        row = {
-            column: self.columns[column][r] for column in self.columns
+        return {
+            column: values[r]
+            for column, values in zip(self._names, self._values)
         }
-        return row
 
     def __next__(self):
         if self.returns_mapping:
@@ -138,10 +226,16 @@ class FSTReader:
         if self.pointer == 1:
             return
         self.pointer = 1
+        if self.first == 1 and self.last > 1 and self.columns is not None:
+            # The first buffer is still loaded
+            return
         self.read_next()
 
     def open(self):
-        self.rewind()
+        self.pointer = 1
+        self.first = 0
+        self.last = 0
+        self.complete = False
         self.read_next()
 
     def __enter__(self):
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from nsaph_utils.utils.fwf import FWFColumn, FWFMeta, FWFReader, parse_date, parse_ints
+
+
+class FWFTests(unittest.TestCase):
+
+    columns = [
+        FWFColumn(0, "id", "NUM", 0, (4, 0)),
+        FWFColumn(1, "dt", "DATE", 4, (9, 0)),
+        FWFColumn(2, "name", "CHAR", 13, (5, 0)),
+    ]
+
+    rows = [
+        b"  12" + b"20200115 " + b" abc ",
+        b"    " + b"15JAN2020" + b"  de ",
+        b"  -3" + b"         " + b" fgh ",
+    ]
+
+    def read(self, eol: bytes, ret_dict: bool = False):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "test.dat")
+            with open(path, "wb") as f:
+                f.write(eol.join(self.rows) + eol)
+            meta = FWFMeta(path, 18, self.columns)
+            with FWFReader(meta, ret_dict=ret_dict) as reader:
+                return list(reader)
+
+    def test_parse_date(self):
+        self.assertEqual(parse_date("20200115"), datetime(2020, 1, 15))
+        self.assertEqual(parse_date("15JAN2020"), datetime(2020, 1, 15))
+        self.assertEqual(parse_date("2020-01-15"), datetime(2020, 1, 15))
+        self.assertEqual(parse_date("01/15/2020"), datetime(2020, 1, 15))
+        self.assertEqual(parse_date("January 15, 2020"), datetime(2020, 1, 15))
+
+    def test_parse_ints(self):
+        values = np.array([b"  12", b"    ", b"-3  ", b"+004"], dtype="S4")
+        self.assertEqual(parse_ints(values), [12, None, -3, 4])
+        with self.assertRaises(ValueError):
+            parse_ints(np.array([b"  12", b"1.5 "], dtype="S4"))
+
+    def test_read(self):
+        expected = [
+            [12, datetime(2020, 1, 15), " abc "],
+            [None, datetime(2020, 1, 15), "  de "],
+            [-3, None, " fgh "],
+        ]
+        for eol in (b"\n", b"\r\n"):
+            self.assertEqual(self.read(eol), expected)
+
+    def test_misaligned(self):
+        rows = self.rows
+        try:
+            self.rows = [rows[0], rows[1] + b" ", rows[2]]
+            with self.assertLogs(level="WARNING") as logs:
+                self.read(b"\n")
+        finally:
+            self.rows = rows
+        self.assertIn("after record 2", logs.output[0])
+
+    def test_truncated(self):
+        rows = self.rows
+        try:
+            self.rows = rows + [rows[0][:10]]
+            with self.assertLogs(level="WARNING") as logs:
+                records = self.read(b"\n")
+        finally:
+            self.rows = rows
+        self.assertEqual(len(records), 3)
+        self.assertIn("Incomplete record", logs.output[0])
+
+    def test_read_dict(self):
+        records = self.read(b"\n", ret_dict=True)
+        self.assertEqual(records[2], {"id": -3, "dt": None, "name": " fgh "})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+import csv
+import io
+import os
+import re
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from requests.structures import CaseInsensitiveDict
+
+from nsaph_utils.utils import io_utils
+from nsaph_utils.utils.io_utils import write_csv, _RowView, CSVFileWrapper, \
+    DownloadTask, save_etags, clear_remote_cache
+
+
+class WriteCSVTests(unittest.TestCase):
+
+    text = "a,b,c\r\n1,2,3\r\n4,5\r\n\r\n6,7,8\r\n9,10,11\r\n"
+
+    @staticmethod
+    def rewrite(text, fieldnames=None, transformer=None, filter=None,
+                reference=False):
+        reader = csv.DictReader(io.StringIO(text))
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames or ["a", "b", "c"])
+        if reference:
+            writer.writeheader()
+            for row in reader:
+                if transformer:
+                    transformer(row)
+                if (not filter) or filter(row):
+                    writer.writerow(row)
+        else:
+            write_csv(reader, writer, transformer, filter)
+        return output.getvalue()
+
+    def assertSameAsDictWriter(self, text=None, **kwargs):
+        text = text or self.text
+        self.assertEqual(self.rewrite(text, reference=True, **kwargs),
+                         self.rewrite(text, **kwargs))
+
+    def test_copy_rows(self):
+        self.assertSameAsDictWriter()
+        self.assertSameAsDictWriter("a,b,c\r\n")
+
+    def test_copy_long_row(self):
+        with self.assertRaises(ValueError):
+            self.rewrite("a,b,c\r\n1,2,3,4\r\n")
+
+    def test_transform_rows(self):
+        def transformer(row):
+            row["a"] = int(row["a"]) * 10
+        self.assertSameAsDictWriter(transformer=transformer)
+        self.assertSameAsDictWriter(filter=lambda row: row["a"] != "6")
+        self.assertSameAsDictWriter(transformer=transformer,
+                                    filter=lambda row: row["a"] > 10)
+
+    def test_transform_deleted_key(self):
+        def transformer(row):
+            del row["b"]
+        self.assertSameAsDictWriter(transformer=transformer)
+
+    def test_transform_added_key(self):
+        def transformer(row):
+            row["d"] = row["a"]
+        with self.assertRaises(ValueError):
+            self.rewrite(self.text, transformer=transformer)
+
+    def test_schema_writer(self):
+        fieldnames = ["c", "a", "d"]
+
+        def transformer(row):
+            row["d"] = row["a"] + "!"
+            del row["b"]
+        self.assertSameAsDictWriter(fieldnames=fieldnames,
+                                    transformer=transformer)
+        self.assertSameAsDictWriter(fieldnames=["a", "b"],
+                                    transformer=lambda row: row.pop("c", None))
+
+    def test_schema_writer_missing_key(self):
+        self.assertSameAsDictWriter(fieldnames=["a", "b", "c", "d"])
+
+
+class RowViewTests(unittest.TestCase):
+
+    def test_row_view(self):
+        index = {"a": 0, "b": 1}
+        values = ["1", "2"]
+        row = _RowView(index, values)
+        self.assertEqual({"a": "1", "b": "2"}, row.copy())
+        self.assertTrue(row.is_positional())
+
+        copy = row.copy()
+        copy["a"] = "x"
+        self.assertEqual("1", row["a"])
+
+        row["a"] = "3"
+        self.assertEqual(["3", "2"], values)
+        self.assertTrue(row.is_positional())
+
+        del row["b"]
+        self.assertNotIn("b", row)
+        self.assertFalse(row.is_positional())
+        row["c"] = "4"
+        self.assertEqual({"a": "3", "c": "4"}, dict(row))
+        self.assertEqual(2, len(row))
+        with self.assertRaises(KeyError):
+            row["b"]
+
+
+class CSVFileWrapperTests(unittest.TestCase):
+
+    text = "a,b,c\n1,,3\n,,\n4,5,\n,\n6,7,8\n"
+    expected = "a,b,c\n1,NA,3\n,NA,NA\n4,5,NA\n,NA\n6,7,8\n"
+
+    @staticmethod
+    def read_all(wrapper, size):
+        parts = []
+        while True:
+            part = wrapper.read(size)
+            if not part:
+                return parts[0][:0].join(parts) if parts else part
+            parts.append(part)
+
+    def test_replacement(self):
+        wrapper = CSVFileWrapper(io.StringIO(self.text))
+        self.assertEqual(self.expected, wrapper.read())
+        self.assertEqual(self.expected.count("\n"), wrapper.line_number)
+
+        wrapper = CSVFileWrapper(io.StringIO("x,\\,\n"), null_replacement="\\N")
+        self.assertEqual("x,\\,\\N\n", wrapper.read())
+
+        wrapper = CSVFileWrapper(io.StringIO("x;;y\n"), sep=";")
+        self.assertEqual("x;NA;y\n", wrapper.readline())
+
+    def test_read_boundaries(self):
+        for size in range(1, len(self.text) + 2):
+            wrapper = CSVFileWrapper(io.StringIO(self.text))
+            self.assertEqual(self.expected, self.read_all(wrapper, size), size)
+            wrapper = CSVFileWrapper(io.BytesIO(self.text.encode("utf-8")))
+            self.assertEqual(self.expected.encode("utf-8"),
+                             self.read_all(wrapper, size), size)
+
+    def test_stream_members(self):
+        stream = io.TextIOWrapper(io.BytesIO(self.text.encode("utf-8")),
+                                  encoding="utf-8")
+        wrapper = CSVFileWrapper(stream)
+        self.assertEqual("utf-8", wrapper.encoding)
+        self.assertTrue(wrapper.seekable())
+        wrapper.read(4)
+        wrapper.seek(0)
+        self.assertEqual(0, wrapper.tell())
+        self.assertEqual(self.expected, wrapper.read())
+
+        del wrapper
+        self.assertFalse(stream.closed)
+        with CSVFileWrapper(stream):
+            pass
+        self.assertTrue(stream.closed)
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, headers, body=b"", delay=0):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.reason = str(status_code)
+        self.headers = CaseInsensitiveDict(headers)
+        self.url = "http://test/data.bin"
+        self.body = body
+        self.delay = delay
+
+    def iter_content(self, chunk_size=1):
+        # The first part is delayed, so that it is written last
+        time.sleep(self.delay)
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """
+    A server that has changed the content since it has been partially
+    downloaded and sends byte ranges of the new content
+    """
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.headers = {
+            "ETag": '"new"',
+            "Accept-Ranges": "bytes",
+            "Content-Length": str(len(content)),
+            "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT",
+        }
+
+    def head(self, url, allow_redirects=True, params=None):
+        return FakeResponse(200, self.headers)
+
+    def get(self, url, stream=True, allow_redirects=True, headers=None):
+        headers = headers or dict()
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", headers.get("Range", ""))
+        if not match:
+            return FakeResponse(200, self.headers, self.content)
+        start = int(match.group(1))
+        if not match.group(2):
+            # Partial content is of a different length than the new one
+            size = len(self.content)
+            return FakeResponse(416, {"Content-Range": "bytes */{:d}".format(size)})
+        end = int(match.group(2)) + 1
+        part = {
+            "ETag": '"new"',
+            "Content-Range": "bytes {:d}-{:d}/{:d}"
+                .format(start, end - 1, len(self.content)),
+        }
+        return FakeResponse(206, part, self.content[start:end],
+                            delay=0.2 if start == 0 else 0)
+
+
+class DownloadTests(unittest.TestCase):
+
+    url = "http://test/data.bin"
+
+    def setUp(self):
+        clear_remote_cache()
+
+    def test_resume_changed_content(self):
+        content = bytes(range(256)) * 40
+        with tempfile.TemporaryDirectory() as tmp:
+            destination = os.path.join(tmp, "data.bin")
+            with open(destination, "wb") as f:
+                f.write(b"old content")
+            save_etags(destination, {self.url: '"old"'})
+            with mock.patch.object(io_utils, "_SESSION", FakeSession(content)), \
+                    mock.patch.object(io_utils, "MIN_RANGE_DOWNLOAD_SIZE", 0):
+                DownloadTask(destination, [self.url]).download(resume=True)
+            with open(destination, "rb") as f:
+                self.assertEqual(content, f.read())
+            self.assertEqual({self.url: '"new"'}, io_utils.load_etags(destination))
+
+
+if __name__ == '__main__':
+    unittest.main()
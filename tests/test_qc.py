@@ -3,6 +3,8 @@ import nsaph_utils.qc
 import pandas as pd
 import numpy as np
 import os
+import shutil
+import tempfile
 
 
 class QCTests(unittest.TestCase):
@@ -20,6 +22,34 @@ class QCTests(unittest.TestCase):
                            "z": [np.nan for a in range(100)],
                            "w": [1 for a in range(100)]})
         self.assertFalse(tester.check(df))
+        self.assertFalse(tester.check(df, strict=True))
+
+    def test_strict_stops_in_list_order(self):
+        df = pd.DataFrame({"x": [a for a in range(100)],
+                           "y": ["a" for a in range(100, 0, -1)],
+                           "z": [np.nan for a in range(100)],
+                           "w": [1 for a in range(100)]})
+        tester = nsaph_utils.qc.Tester("strict", yaml_file=os.path.dirname(__file__) + "/test_data/test_list.yml")
+        for _ in range(5):
+            with self.assertLogs(tester._logger, level="DEBUG") as logs:
+                self.assertFalse(tester.check(df, strict=True))
+            failures = [r for r in logs.records if not r.getMessage().startswith("Tests stopped")]
+            # Only the first test of the list, on variable x, has run
+            self.assertEqual(1, len(failures))
+            self.assertEqual("DEBUG", failures[0].levelname)
+
+    def test_cached_test_list(self):
+        source = os.path.dirname(__file__) + "/test_data/test_list.yml"
+        with tempfile.TemporaryDirectory() as tmp:
+            yaml_file = os.path.join(tmp, "test_list.yml")
+            shutil.copy(source, yaml_file)
+            parsed = nsaph_utils.qc.tester.load_test_list(yaml_file)
+            self.assertEqual(parsed, nsaph_utils.qc.tester.load_test_list(yaml_file))
+            self.assertEqual(os.listdir(tmp), ["test_list.yml"])
+
+            with open(yaml_file, "a") as f:
+                f.write("\n-\n  condition: no_missing\n  variable: x\n  severity: info\n")
+            self.assertEqual(len(parsed) + 1, len(nsaph_utils.qc.tester.load_test_list(yaml_file)))
 
 
 if __name__ == '__main__':